@@ -2,10 +2,12 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import io
 import json
+import click
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, session, stream_with_context
 from flask_moment import Moment
 from models import *
 from flask_migrate import Migrate
@@ -13,17 +15,36 @@ import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-from datetime import datetime
+from queries import *
+from fsnd_common.caching import CollectionVersions, conditional
+from fsnd_common.encoding import FastJSONEncoder
+from fsnd_common.compression import init_compression
+from fsnd_common.profiling import init_profiling
+from fsnd_common.metrics import init_metrics, pool_collector, cache_collector, replica_collector
+from fsnd_common.replicas import init_replicas, read_only
+from references import genre_cache, get_or_create_location
+from ingest import ingest, read_records, guess_format, IngestError, CHUNK_SIZE, FORMATS, LOADERS
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
 app = Flask(__name__)
+app.json_encoder = FastJSONEncoder
 moment = Moment(app)
 app.config.from_object('config')
 
 db.init_app(app)
 migrate = Migrate(app,db)
+init_compression(app)
+init_profiling(app)
+init_replicas(app, db)
+init_metrics(app, pool_collector(db), cache_collector('genres', genre_cache.stats), replica_collector(app))
+
+versions = CollectionVersions(db)
+versions.track('venues', Venue, Location, Show)
+versions.track('artists', Artist)
+versions.track('shows', Show, Venue, Artist)
+versions.listen()
 
 
 
@@ -54,48 +75,22 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(versions, 'venues')
 def venues():
-  data = list()
-  locations = Location.query.all()
-
-  for location in locations:
-      entry = dict()
-      entry['city']=location.city
-      entry['state']=location.state
-      venues_list=list()
-      for venue in location.venues:
-        venues_list.append({'id': venue.id,
-                            'name': venue.name,
-                          })
-      entry['venues']=venues_list
-      data.append(entry)
-     
-
+  data = venue_directory()
   return render_template('pages/venues.html', areas=data)
 
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
-  search_term = request.form.get('search_term')
-  #results = Venue.query.filter(Venue.name.contains(search_term)).all() # Case sensitive match
-  results = Venue.query.filter(Venue.name.ilike(f"%{search_term}%")).all() # Ignore Case match
-
-  response={
-    "count": len(results),
-    "data": [{
-      "id": result.id,
-      "name": result.name,
-      "num_upcoming_shows": 1,
-    } for result in results]
-  }
+  search_term = request.form.get('search_term', '')
+  response = search_with_upcoming_shows(Venue, Show.venue_id, search_term)
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   venue = Venue.query.get(venue_id)
-  current_time = datetime.utcnow()
 
-  past_shows = Show.query.join(Venue,Venue.id==Show.venue_id).filter(Venue.id==venue.id,Show.start_time<=current_time).order_by(Show.start_time).all()
-  upcoming_shows = Show.query.join(Venue,Venue.id==Show.venue_id).filter(Venue.id==venue.id,Show.start_time>current_time).order_by(Show.start_time).all()
   data={
     "id": venue_id,
     "name": venue.name,
@@ -109,21 +104,8 @@ def show_venue(venue_id):
     "seeking_talent": venue.seeking_talent,
     "seeking_description": venue.seeking_description,
     "image_link": venue.image_link,
-    "past_shows": [{
-      "artist_id": show.artist.id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": str(show.start_time)
-    } for show in past_shows],
-    "upcoming_shows": [{
-      "artist_id": show.artist.id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": str(show.start_time)
-    } for show in upcoming_shows],
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows),
   }
+  data.update(show_timeline(Show.venue_id, venue.id, Artist))
  
   return render_template('pages/show_venue.html', venue=data)
 
@@ -153,17 +135,9 @@ def create_venue_submission():
   
   city =request.form['city']
   state =request.form['state']
-  location = Location.query.filter(Location.city==city,Location.state==state).first()
-  if location is None:
-    location  = Location(city=city,state=state)
+  location = get_or_create_location(city,state)
 
-  genres_list = request.form.getlist('genres')
-  genres=list()
-  for genre_name in genres_list:
-    genre =Genre.query.filter(Genre.name==genre_name).first()
-    if genre is None:
-      genre = Genre(name=genre_name)
-    genres.append(genre)
+  genres = genre_cache.genres(request.form.getlist('genres'))
 
 
   error = False
@@ -201,7 +175,7 @@ def delete_venue(venue_id):
     db.session.commit()
   except:
     db.session.rollback()
-    print('error','#'*100)
+    app.logger.exception('venue %s could not be deleted', venue_id)
     error = True
   finally:
     db.session.close()
@@ -218,31 +192,21 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@conditional(versions, 'artists')
 def artists():
-  artists = Artist.query.all()
-  return render_template('pages/artists.html', artists=artists)
+  return render_template('pages/artists.html', artists=artist_directory())
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
   search_term=request.form.get('search_term', '')
 
-  artists = Artist.query.filter(Artist.name.ilike(f"%{search_term}%")).all()
-  response={
-    "count": len(artists),
-    "data": [{
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": 0,
-    } for artist in artists]
-  }
+  response = search_with_upcoming_shows(Artist, Show.artist_id, search_term)
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   artist = Artist.query.filter(Artist.id==artist_id).first_or_404()
-  current_time = datetime.utcnow()
-  past_shows = Show.query.join(Artist, Artist.id==Show.artist_id).filter(Show.start_time<=current_time,Artist.id==artist.id).order_by(Show.start_time).all()
-  upcoming_shows = Show.query.join(Artist,Artist.id==Show.artist_id).filter(Show.start_time>current_time,Artist.id==artist.id).order_by(Show.start_time).all()
   data={
     "id": artist.id,
     "name": artist.name,
@@ -255,21 +219,8 @@ def show_artist(artist_id):
     "seeking_venue": artist.seeking_venue,
     "seeking_description": artist.seeking_description,
     "image_link": artist.image_link,
-    "past_shows": [{
-      "venue_id": show.venue.id,
-      "venue_name": show.venue.name ,
-      "venue_image_link": show.venue.image_link,
-      "start_time": str(show.start_time)
-    } for show in past_shows],
-    "upcoming_shows": [{
-      "venue_id": show.venue.id,
-      "venue_name": show.venue.name ,
-      "venue_image_link": show.venue.image_link,
-      "start_time": str(show.start_time)
-    } for show in upcoming_shows],
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows),
   }
+  data.update(show_timeline(Show.artist_id, artist.id, Venue))
   
   return render_template('pages/show_artist.html', artist=data)
 
@@ -302,10 +253,7 @@ def edit_artist_submission(artist_id):
   artist.website_link = request.form['website_link']
   artist.image_link = request.form['image_link']
   
-  location = Location.query.filter(Location.city==request.form['city'],Location.state==request.form['state']).first()
-  if location is None:
-    location = Location(city=request.form['city'],state=request.form['state'])
-  artist.a_location = location
+  artist.a_location = get_or_create_location(request.form['city'],request.form['state'])
 
   if request.form.get('seeking_venue'):
     artist.seeking_venue = True
@@ -314,13 +262,7 @@ def edit_artist_submission(artist_id):
     artist.seeking_venue = False
     artist.seeking_description = None
 
-  genres_list = request.form.getlist('genres')
-  genres=list()
-  for genre_name in genres_list:
-    genre =Genre.query.filter(Genre.name==genre_name).first()
-    if genre is None:
-      genre = Genre(name=genre_name)
-    genres.append(genre)
+  genres = genre_cache.genres(request.form.getlist('genres'))
 
 
   artist.a_genres = genres
@@ -368,35 +310,25 @@ def edit_venue_submission(venue_id):
     seeking_talent=True
     seeking_description = request.form['seeking_description']
   else:
-    print('no'*100)
     seeking_talent=False
     seeking_description=None
   
 
   city =request.form['city']
   state =request.form['state']
-  location = Location.query.filter(Location.city==city,Location.state==state).first()
-  if location is None:
-    location  = Location(city=city,state=state)
+  location = get_or_create_location(city,state)
 
-  genres_list = request.form.getlist('genres')
-  genres=list()
-  for genre_name in genres_list:
-    genre =Genre.query.filter(Genre.name==genre_name).first()
-    if genre is None:
-      genre = Genre(name=genre_name)
-    genres.append(genre)
+  genres = genre_cache.genres(request.form.getlist('genres'))
 
 
 
   error = False
   venue = Venue.query.filter_by(id=venue_id).first_or_404()
-  print(venue)
 
   try:
     venue.name=name
     venue.address=address
-    venue.phone=phone,
+    venue.phone=phone
     venue.facebook_link=facebook_link
     venue.location=location
     venue.genres=genres
@@ -431,15 +363,15 @@ def create_artist_form():
 
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
+  genres = genre_cache.genres(request.form.getlist('genres'))
+  location = get_or_create_location(request.form['city'],request.form['state'])
+
   artist = Artist()
   artist.name = request.form['name']
   artist.phone = request.form['phone']
   artist.facebook_link = request.form['facebook_link']
   artist.website_link = request.form['website_link']
   artist.image_link = request.form['image_link']
-  location = Location.query.filter(Location.city==request.form['city'],Location.state==request.form['state']).first()
-  if location is None:
-    location = Location(city=request.form['city'],state=request.form['state'])
   artist.a_location = location
 
   if request.form.get('seeking_venue'):
@@ -449,15 +381,7 @@ def create_artist_submission():
     artist.seeking_venue = False
     artist.seeking_description = None
 
-  genres_list = request.form.getlist('genres')
-  genres=list()
-  for genre_name in genres_list:
-    genre =Genre.query.filter(Genre.name==genre_name).first()
-    if genre is None:
-      genre = Genre(name=genre_name)
-    genres.append(genre)
-
-
+  artist.a_genres = genres
 
   try:
     db.session.add(artist)
@@ -476,20 +400,37 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
+def date_arg(name):
+  value = request.args.get(name)
+  if value is None:
+    return None
+  try:
+    return dateutil.parser.parse(value)
+  except (ValueError, OverflowError):
+    abort(400)
+
+def stream_template(template_name, **context):
+  '''
+  Like render_template, but sends the page in chunks while the template
+  renders, so the first bytes go out before all of its data is read.
+  '''
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(20)
+  return Response(stream_with_context(stream))
+
 @app.route('/shows')
+@conditional(versions, 'shows')
 def shows():
-  shows = Show.query.all()
-
-  data=[{
-    "venue_id": show.venue.id,
-    "venue_name": show.venue.name,
-    "artist_id": show.artist.id,
-    "artist_name": show.artist.name,
-    "artist_image_link": show.artist.image_link,
-    "start_time": str(show.start_time)
-  } for show in shows]
+  page = ShowsPage(date_arg('from'), date_arg('to'), request.args.get('after',None,type=int))
+  filters = {name: request.args[name] for name in ('from', 'to') if name in request.args}
 
-  return render_template('pages/shows.html', shows=data)
+  # flashed messages are popped from the session while rendering, which
+  # can't be saved any more once a streamed body has started
+  if app.config.get('STREAM_SHOWS') and not session.get('_flashes'):
+    return stream_template('pages/shows.html', shows=page, page=page, filters=filters)
+  return render_template('pages/shows.html', shows=list(page), page=page, filters=filters)
 
 @app.route('/shows/create')
 def create_shows():
@@ -513,6 +454,43 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
+#  Bulk ingestion
+#  ----------------------------------------------------------------
+
+@app.route('/ingest/<kind>', methods=['POST'])
+def ingest_submission(kind):
+  if kind not in LOADERS:
+    abort(404)
+
+  upload = request.files.get('file')
+  if upload is not None:
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8')
+    format = guess_format(upload.filename, upload.content_type)
+  else:
+    stream = io.StringIO(request.get_data(as_text=True))
+    format = guess_format(None, request.content_type)
+  format = request.args.get('format', format)
+  chunk_size = request.args.get('chunk_size', CHUNK_SIZE, type=int)
+
+  try:
+    report = ingest(kind, read_records(stream, format), chunk_size)
+  except (IngestError, ValueError) as e:
+    return jsonify({'success': False, 'error': str(e)}), 422
+  return jsonify(dict(report, success=True))
+
+@app.cli.command('ingest')
+@click.argument('kind', type=click.Choice(sorted(LOADERS)))
+@click.argument('path', type=click.File('r', encoding='utf-8'))
+@click.option('--format', type=click.Choice(FORMATS), help='Defaults to jsonl for .jsonl/.ndjson/.json files, csv otherwise.')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+def ingest_command(kind, path, format, chunk_size):
+  '''Bulk load venues, artists or shows from a CSV or JSON lines file.'''
+  try:
+    report = ingest(kind, read_records(path, format or guess_format(path.name)), chunk_size)
+  except (IngestError, ValueError) as e:
+    raise click.ClickException(str(e))
+  click.echo('{kind}: {rows} rows in {seconds}s ({rows_per_sec} rows/sec)'.format(**report))
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,202 @@
+import csv
+import json
+import time
+import dateutil.parser
+from models import db, Show, Venue, Artist, Venue_Genre, Artist_Genre
+from references import location_ids, genre_cache
+
+#----------------------------------------------------------------------------#
+# Bulk ingestion.
+#
+# Venues, artists and shows arrive as CSV or JSON lines (one object per
+# line) and are written in chunks: the Location/Genre/Venue/Artist
+# references of a whole chunk are resolved with one IN query per table
+# (missing locations and genres created as in references.py),
+# rows go in with bulk_insert_mappings/executemany, and each chunk is its
+# own transaction.
+#----------------------------------------------------------------------------#
+
+CHUNK_SIZE = 1000
+FORMATS = ('csv', 'jsonl')
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+
+class IngestError(Exception):
+  def __init__(self, record, message):
+    super().__init__(f'record {record}: {message}')
+    self.record = record
+    self.message = message
+
+def guess_format(filename, content_type=None):
+  if content_type and ('json' in content_type):
+    return 'jsonl'
+  if filename and filename.endswith(('.jsonl', '.ndjson', '.json')):
+    return 'jsonl'
+  return 'csv'
+
+def read_records(stream, format):
+  '''
+  Yields record dicts from a text stream of CSV with a header row, or of
+  JSON lines.
+  '''
+  if format == 'csv':
+    for record in csv.DictReader(stream):
+      yield record
+  elif format == 'jsonl':
+    for line in stream:
+      if line.strip():
+        yield json.loads(line)
+  else:
+    raise ValueError(f'unknown format {format!r}, expected one of {FORMATS}')
+
+def text(record, key):
+  value = record.get(key)
+  if value is None:
+    return None
+  value = str(value).strip()
+  return value or None
+
+def flag(record, key):
+  value = record.get(key)
+  if isinstance(value, bool):
+    return value
+  return str(value or '').strip().lower() in TRUE_VALUES
+
+def genre_names(record):
+  genres = record.get('genres') or []
+  if isinstance(genres, str):
+    genres = genres.split(';')
+  return [name.strip() for name in genres if name and name.strip()]
+
+def chunked(records, chunk_size):
+  chunk = list()
+  for line, record in enumerate(records, start=1):
+    chunk.append((line, record))
+    if len(chunk) == chunk_size:
+      yield chunk
+      chunk = list()
+  if chunk:
+    yield chunk
+
+#----------------------------------------------------------------------------#
+# Reference resolution.
+#----------------------------------------------------------------------------#
+
+def resolve_ids(model, ids, names):
+  '''
+  Returns the subset of ids that exist, and a name -> id map for names,
+  for one model (Venue or Artist), using one query each.
+  '''
+  existing = set()
+  if ids:
+    existing = {id for id, in db.session.query(model.id).filter(model.id.in_(ids))}
+  by_name = dict()
+  if names:
+    by_name = {name: id for name, id in
+               db.session.query(model.name, model.id).filter(model.name.in_(names)).order_by(model.id.desc())}
+  return existing, by_name
+
+#----------------------------------------------------------------------------#
+# Loaders, one chunk at a time.
+#----------------------------------------------------------------------------#
+
+def load_profiles(model, association, foreign_key, chunk, fields, flags):
+  locations = location_ids((text(r, 'city'), text(r, 'state')) for line, r in chunk
+                         if text(r, 'city') and text(r, 'state'))
+  genres = genre_cache.genre_ids(name for line, r in chunk for name in genre_names(r))
+
+  mappings = list()
+  for line, record in chunk:
+    if not text(record, 'name'):
+      raise IngestError(line, 'name is required')
+    location_id = locations.get((text(record, 'city'), text(record, 'state')))
+    if location_id is None:
+      raise IngestError(line, 'city and state are required')
+    mapping = {field: text(record, field) for field in fields}
+    mapping.update({field: flag(record, field) for field in flags})
+    mapping['location_id'] = location_id
+    if mapping.get('image_link') is None:
+      del mapping['image_link']
+    mappings.append(mapping)
+
+  db.session.bulk_insert_mappings(model, mappings, return_defaults=True)
+
+  links = {(mapping['id'], genres[name]) for mapping, (line, record) in zip(mappings, chunk)
+           for name in genre_names(record)}
+  if links:
+    db.session.execute(association.insert(),
+                       [{foreign_key: id, 'genre_id': genre_id} for id, genre_id in links])
+  return len(mappings)
+
+def load_venues(chunk):
+  return load_profiles(Venue, Venue_Genre, 'venue_id', chunk,
+                       ('name', 'address', 'phone', 'image_link', 'facebook_link',
+                        'website_link', 'seeking_description'),
+                       ('seeking_talent',))
+
+def load_artists(chunk):
+  return load_profiles(Artist, Artist_Genre, 'artist_id', chunk,
+                       ('name', 'phone', 'image_link', 'facebook_link',
+                        'website_link', 'seeking_description'),
+                       ('seeking_venue',))
+
+def load_shows(chunk):
+  def reference(record, key):
+    value = text(record, key + '_id')
+    return int(value) if value is not None else None
+
+  venues, venue_names = resolve_ids(Venue,
+                                    {reference(r, 'venue') for l, r in chunk} - {None},
+                                    {text(r, 'venue_name') for l, r in chunk} - {None})
+  artists, artist_names = resolve_ids(Artist,
+                                      {reference(r, 'artist') for l, r in chunk} - {None},
+                                      {text(r, 'artist_name') for l, r in chunk} - {None})
+
+  mappings = list()
+  for line, record in chunk:
+    venue_id = reference(record, 'venue')
+    venue_id = venue_id if venue_id in venues else venue_names.get(text(record, 'venue_name'))
+    artist_id = reference(record, 'artist')
+    artist_id = artist_id if artist_id in artists else artist_names.get(text(record, 'artist_name'))
+    if venue_id is None:
+      raise IngestError(line, 'unknown venue')
+    if artist_id is None:
+      raise IngestError(line, 'unknown artist')
+    try:
+      start_time = dateutil.parser.parse(text(record, 'start_time'))
+    except (TypeError, ValueError, OverflowError):
+      raise IngestError(line, 'start_time is not a date')
+    mappings.append({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time})
+
+  db.session.bulk_insert_mappings(Show, mappings)
+  return len(mappings)
+
+LOADERS = {
+  'venues': load_venues,
+  'artists': load_artists,
+  'shows': load_shows,
+}
+
+def ingest(kind, records, chunk_size=CHUNK_SIZE):
+  '''
+  Writes records of kind ('venues', 'artists' or 'shows') in chunked
+  transactions. A bad record raises IngestError after the chunks before
+  its own were committed. Returns the rows written, seconds taken and
+  rows per second.
+  '''
+  load = LOADERS[kind]
+  rows = 0
+  started = time.perf_counter()
+  for chunk in chunked(records, chunk_size):
+    try:
+      rows += load(chunk)
+      db.session.commit()
+    except:
+      db.session.rollback()
+      raise
+  seconds = time.perf_counter() - started
+  return {
+    'kind': kind,
+    'rows': rows,
+    'seconds': round(seconds, 3),
+    'rows_per_sec': round(rows / seconds, 1) if seconds else None,
+  }
@@ -0,0 +1,61 @@
+"""trigram search indexes on Venue and Artist names
+
+Revision ID: 3f1c0d9a7b52
+Revises: df2893bafa2a
+Create Date: 2021-02-08 10:12:31.204118
+
+"""
+import logging
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c0d9a7b52'
+down_revision = 'df2893bafa2a'
+branch_labels = None
+depends_on = None
+
+SEARCH_TABLES = ['Venue', 'Artist']
+
+logger = logging.getLogger('alembic.env')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name in SEARCH_TABLES:
+            op.create_index('ix_{}_name_trgm'.format(name), name, ['name'],
+                            postgresql_using='gin',
+                            postgresql_ops={'name': 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        for name in SEARCH_TABLES:
+            try:
+                op.execute('CREATE VIRTUAL TABLE "{0}_fts" USING fts5('
+                           'name, content=\'{0}\', content_rowid=\'id\', tokenize=\'trigram\')'.format(name))
+            except sa.exc.OperationalError as e:
+                # SQLite before 3.34, or built without FTS5: without the
+                # table, search.name_search falls back to ILIKE
+                logger.warning('%s search falls back to LIKE, no FTS5 trigram index: %s', name, e.orig)
+                continue
+            op.execute('CREATE TRIGGER "{0}_fts_ai" AFTER INSERT ON "{0}" BEGIN '
+                       'INSERT INTO "{0}_fts"(rowid, name) VALUES (new.id, new.name); END'.format(name))
+            op.execute('CREATE TRIGGER "{0}_fts_ad" AFTER DELETE ON "{0}" BEGIN '
+                       'INSERT INTO "{0}_fts"("{0}_fts", rowid, name) VALUES (\'delete\', old.id, old.name); END'.format(name))
+            op.execute('CREATE TRIGGER "{0}_fts_au" AFTER UPDATE OF name ON "{0}" BEGIN '
+                       'INSERT INTO "{0}_fts"("{0}_fts", rowid, name) VALUES (\'delete\', old.id, old.name); '
+                       'INSERT INTO "{0}_fts"(rowid, name) VALUES (new.id, new.name); END'.format(name))
+            op.execute('INSERT INTO "{0}_fts"("{0}_fts") VALUES (\'rebuild\')'.format(name))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for name in SEARCH_TABLES:
+            op.drop_index('ix_{}_name_trgm'.format(name), table_name=name)
+    elif dialect == 'sqlite':
+        for name in SEARCH_TABLES:
+            for trigger in ('ai', 'ad', 'au'):
+                op.execute('DROP TRIGGER IF EXISTS "{}_fts_{}"'.format(name, trigger))
+            op.execute('DROP TABLE IF EXISTS "{}_fts"'.format(name))
@@ -0,0 +1,53 @@
+"""unique Genre names and Location city/state pairs
+
+Revision ID: 8b4e2f61c0d7
+Revises: 3f1c0d9a7b52
+Create Date: 2021-02-10 18:41:07.551290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e2f61c0d7'
+down_revision = '3f1c0d9a7b52'
+branch_labels = None
+depends_on = None
+
+
+def merge_genre_links(table, owner):
+    # drop links that would collide once duplicates point at the same genre,
+    # then point the rest at the lowest id of each name
+    op.execute('DELETE FROM "{0}" AS link WHERE EXISTS ('
+               'SELECT 1 FROM "{0}" AS other '
+               'JOIN "Genre" AS kept ON kept.id = other.genre_id '
+               'JOIN "Genre" AS dup ON dup.id = link.genre_id '
+               'WHERE other.{1} = link.{1} AND kept.name = dup.name AND kept.id < dup.id)'.format(table, owner))
+    op.execute('UPDATE "{0}" SET genre_id = ('
+               'SELECT min(kept.id) FROM "Genre" AS kept JOIN "Genre" AS dup ON dup.name = kept.name '
+               'WHERE dup.id = "{0}".genre_id)'.format(table))
+
+
+def merge_locations(table):
+    op.execute('UPDATE "{0}" SET location_id = ('
+               'SELECT min(kept.id) FROM "Location" AS kept JOIN "Location" AS dup '
+               'ON dup.city = kept.city AND dup.state = kept.state '
+               'WHERE dup.id = "{0}".location_id)'.format(table))
+
+
+def upgrade():
+    merge_genre_links('Venue_Genre', 'venue_id')
+    merge_genre_links('Artist_Genre', 'artist_id')
+    op.execute('DELETE FROM "Genre" WHERE id NOT IN (SELECT min(id) FROM "Genre" GROUP BY name)')
+    op.create_index('ix_Genre_name', 'Genre', ['name'], unique=True)
+
+    merge_locations('Venue')
+    merge_locations('Artist')
+    op.execute('DELETE FROM "Location" WHERE id NOT IN (SELECT min(id) FROM "Location" GROUP BY city, state)')
+    op.create_index('ix_Location_city_state', 'Location', ['city', 'state'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_Location_city_state', table_name='Location')
+    op.drop_index('ix_Genre_name', table_name='Genre')
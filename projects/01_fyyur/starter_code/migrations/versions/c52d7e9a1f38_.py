@@ -0,0 +1,38 @@
+"""indexes for the show timelines and foreign keys
+
+Revision ID: c52d7e9a1f38
+Revises: 8b4e2f61c0d7
+Create Date: 2021-02-12 09:27:44.318652
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52d7e9a1f38'
+down_revision = '8b4e2f61c0d7'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns): the show timelines of the venue and artist pages
+# filter on the foreign key and range over / order by start_time; the rest
+# cover the foreign keys the primary keys don't lead with
+INDEXES = [
+    ('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time']),
+    ('ix_Venue_Genre_genre_id', 'Venue_Genre', ['genre_id']),
+    ('ix_Artist_Genre_genre_id', 'Artist_Genre', ['genre_id']),
+    ('ix_Venue_location_id', 'Venue', ['location_id']),
+    ('ix_Artist_location_id', 'Artist', ['location_id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
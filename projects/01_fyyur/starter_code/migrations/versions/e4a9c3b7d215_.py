@@ -0,0 +1,39 @@
+"""collection versions bumped by triggers, for the ETags of the list pages
+
+Revision ID: e4a9c3b7d215
+Revises: c52d7e9a1f38
+Create Date: 2021-02-15 11:02:39.804417
+
+"""
+from alembic import op
+from fsnd_common.caching import CollectionVersions
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9c3b7d215'
+down_revision = 'c52d7e9a1f38'
+branch_labels = None
+depends_on = None
+
+# collection: the tables its pages are built from, as app.py tracks them
+# when this revision was written
+COLLECTIONS = {
+    'venues': ['Venue', 'Location', 'Show'],
+    'artists': ['Artist'],
+    'shows': ['Show', 'Venue', 'Artist'],
+}
+
+
+def collection_versions():
+    versions = CollectionVersions()
+    for collection, tables in COLLECTIONS.items():
+        versions.track(collection, *tables)
+    return versions
+
+
+def upgrade():
+    collection_versions().install(op.get_bind())
+
+
+def downgrade():
+    collection_versions().uninstall(op.get_bind())
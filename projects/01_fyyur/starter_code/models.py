@@ -1,6 +1,6 @@
-from flask_sqlalchemy import SQLAlchemy
+from fsnd_common.replicas import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -9,6 +9,9 @@ db = SQLAlchemy()
 
 class Show(db.Model):
   __tablename__='Show'
+  __table_args__ = (db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+                    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'))
+
   id = db.Column(db.Integer,primary_key=True)
   venue_id = db.Column(db.Integer,db.ForeignKey('Venue.id'))
   artist_id = db.Column(db.Integer,db.ForeignKey('Artist.id'))
@@ -17,6 +20,7 @@ class Show(db.Model):
 
 class Location(db.Model):
     __tablename__ = 'Location'
+    __table_args__ = (db.Index('ix_Location_city_state', 'city', 'state', unique=True),)
 
     id = db.Column(db.Integer,primary_key=True)
     city = db.Column(db.String(120),nullable=False)
@@ -26,15 +30,18 @@ class Location(db.Model):
 
 Venue_Genre= db.Table('Venue_Genre',
               db.Column('venue_id',db.Integer,db.ForeignKey('Venue.id'),primary_key=True),
-              db.Column('genre_id',db.Integer,db.ForeignKey('Genre.id'),primary_key=True))
+              db.Column('genre_id',db.Integer,db.ForeignKey('Genre.id'),primary_key=True),
+              db.Index('ix_Venue_Genre_genre_id','genre_id'))
               
 Artist_Genre= db.Table('Artist_Genre',
               db.Column('artist_id',db.Integer,db.ForeignKey('Artist.id'),primary_key=True),
-              db.Column('genre_id',db.Integer,db.ForeignKey('Genre.id'),primary_key=True))
+              db.Column('genre_id',db.Integer,db.ForeignKey('Genre.id'),primary_key=True),
+              db.Index('ix_Artist_Genre_genre_id','genre_id'))
               
 
 class Genre(db.Model):
   __tablename__ ='Genre'
+  __table_args__ = (db.Index('ix_Genre_name', 'name', unique=True),)
 
   id = db.Column(db.Integer,primary_key=True)
   name = db.Column(db.String(),nullable=False)
@@ -45,6 +52,8 @@ class Genre(db.Model):
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin',
+                               postgresql_ops={'name': 'gin_trgm_ops'}),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -55,7 +64,7 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500),default="https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60")
     facebook_link = db.Column(db.String(120))
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
-    location_id = db.Column(db.Integer,db.ForeignKey('Location.id'),nullable=False)
+    location_id = db.Column(db.Integer,db.ForeignKey('Location.id'),nullable=False,index=True)
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean,default=False)
     seeking_description =db.Column(db.Text)
@@ -63,6 +72,8 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin',
+                               postgresql_ops={'name': 'gin_trgm_ops'}),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -77,7 +88,7 @@ class Artist(db.Model):
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean,default=False)
     seeking_description =db.Column(db.Text)
-    location_id = db.Column(db.Integer,db.ForeignKey('Location.id'),nullable=False)
+    location_id = db.Column(db.Integer,db.ForeignKey('Location.id'),nullable=False,index=True)
     shows = db.relationship('Show',backref='artist')
 
     def __repr__(self):
@@ -0,0 +1,159 @@
+from datetime import datetime
+from sqlalchemy import func, and_, or_
+from models import db, Show, Location, Venue, Artist
+from search import name_search
+
+SHOWS_PER_PAGE = 30
+
+#----------------------------------------------------------------------------#
+# Loaders.
+#----------------------------------------------------------------------------#
+
+def upcoming_shows_count(column, now=None):
+  '''
+  Subquery of (<column>, num_upcoming_shows) grouped by the given Show
+  foreign key column, for joining against Venue or Artist.
+  '''
+  if now is None:
+    now = datetime.utcnow()
+  return db.session.query(column.label('id'),
+                          func.count(Show.id).label('num_upcoming_shows'))\
+                   .filter(Show.start_time > now)\
+                   .group_by(column)\
+                   .subquery()
+
+def upcoming_shows_of(model, foreign_key, now=None):
+  '''
+  Scalar subquery counting the upcoming shows of each model (Venue or
+  Artist) row of the enclosing query, through the (foreign key,
+  start_time) index, so only the rows the query returns are counted.
+  '''
+  if now is None:
+    now = datetime.utcnow()
+  return db.session.query(func.count(Show.id))\
+                   .filter(foreign_key == model.id, Show.start_time > now)\
+                   .correlate(model)\
+                   .as_scalar()
+
+def venue_directory(now=None):
+  '''
+  Venues grouped by city/state with their upcoming show counts, built from a
+  single query whatever the number of locations.
+  '''
+  upcoming = upcoming_shows_count(Show.venue_id, now)
+  rows = db.session.query(Location.id, Location.city, Location.state,
+                          Venue.id, Venue.name,
+                          func.coalesce(upcoming.c.num_upcoming_shows, 0))\
+                   .outerjoin(Venue, Venue.location_id == Location.id)\
+                   .outerjoin(upcoming, upcoming.c.id == Venue.id)\
+                   .order_by(Location.id, Venue.id)\
+                   .all()
+
+  areas = dict()
+  for location_id, city, state, venue_id, venue_name, num_upcoming_shows in rows:
+    area = areas.get(location_id)
+    if area is None:
+      area = areas[location_id] = {'city': city, 'state': state, 'venues': []}
+    if venue_id is not None:
+      area['venues'].append({'id': venue_id,
+                             'name': venue_name,
+                             'num_upcoming_shows': num_upcoming_shows,
+                            })
+  return list(areas.values())
+
+def artist_directory():
+  '''
+  The id and name of every artist for the artists page, read as plain rows.
+  '''
+  return [{'id': id, 'name': name}
+          for id, name in db.session.query(Artist.id, Artist.name).order_by(Artist.id)]
+
+def show_timeline(foreign_key, entity_id, counterpart, now=None):
+  '''
+  The past and upcoming shows of one venue or artist, for its page: shows
+  are read once with the counterpart Artist or Venue joined in, and split
+  at now in a single pass over the start_time order.
+  '''
+  if now is None:
+    now = datetime.utcnow()
+  prefix = counterpart.__tablename__.lower()
+  rows = db.session.query(Show.start_time, counterpart.id, counterpart.name, counterpart.image_link)\
+                   .join(counterpart, getattr(Show, prefix + '_id') == counterpart.id)\
+                   .filter(foreign_key == entity_id)\
+                   .order_by(Show.start_time)\
+                   .all()
+
+  timeline = {'past_shows': [], 'upcoming_shows': []}
+  for start_time, id, name, image_link in rows:
+    shows = timeline['past_shows'] if start_time <= now else timeline['upcoming_shows']
+    shows.append({
+      prefix + '_id': id,
+      prefix + '_name': name,
+      prefix + '_image_link': image_link,
+      'start_time': str(start_time)
+    })
+  timeline['past_shows_count'] = len(timeline['past_shows'])
+  timeline['upcoming_shows_count'] = len(timeline['upcoming_shows'])
+  return timeline
+
+class ShowsPage:
+  '''
+  One page of the /shows listing, ordered by (start_time, id) and read
+  with a single joined projection of the venue and artist columns (no ORM
+  objects). Rows are produced while iterating so the page can be streamed;
+  next_cursor, the ?after= value of the following page, is set once the
+  iteration has found there is one.
+
+  start and end bound start_time (start inclusive, end exclusive), after
+  is the id of the last show of the previous page (keyset pagination).
+  '''
+  def __init__(self, start=None, end=None, after=None, per_page=SHOWS_PER_PAGE):
+    query = db.session.query(Show.id, Show.start_time, Venue.id, Venue.name,
+                             Artist.id, Artist.name, Artist.image_link)\
+                      .join(Venue, Venue.id == Show.venue_id)\
+                      .join(Artist, Artist.id == Show.artist_id)
+    if start is not None:
+      query = query.filter(Show.start_time >= start)
+    if end is not None:
+      query = query.filter(Show.start_time < end)
+    if after is not None:
+      after_time = db.session.query(Show.start_time).filter(Show.id == after).as_scalar()
+      query = query.filter(or_(Show.start_time > after_time,
+                               and_(Show.start_time == after_time, Show.id > after)))
+    # one row past the page tells whether there is a next one
+    self.query = query.order_by(Show.start_time, Show.id).limit(per_page + 1)
+    self.per_page = per_page
+    self.next_cursor = None
+
+  def __iter__(self):
+    last_id = None
+    for count, row in enumerate(self.query):
+      if count == self.per_page:
+        self.next_cursor = last_id
+        break
+      id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link = row
+      last_id = id
+      yield {
+        "venue_id": venue_id,
+        "venue_name": venue_name,
+        "artist_id": artist_id,
+        "artist_name": artist_name,
+        "artist_image_link": artist_image_link,
+        "start_time": str(start_time)
+      }
+
+def search_with_upcoming_shows(model, foreign_key, search_term, now=None):
+  '''
+  Ranked name search over Venue or Artist, returning the search page
+  response with real upcoming show counts, counted for the matches only.
+  '''
+  query = db.session.query(model.id, model.name, upcoming_shows_of(model, foreign_key, now))
+  rows = name_search(query, model, search_term).all()
+  return {
+    "count": len(rows),
+    "data": [{
+      "id": id,
+      "name": name,
+      "num_upcoming_shows": num_upcoming_shows,
+    } for id, name, num_upcoming_shows in rows]
+  }
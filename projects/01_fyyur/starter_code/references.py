@@ -0,0 +1,136 @@
+import threading
+from sqlalchemy import event, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from models import db, Location, Genre
+
+#----------------------------------------------------------------------------#
+# Reference data.
+#
+# Genres and locations are get-or-create lookups shared by the create/edit
+# views and bulk ingestion. Missing rows are added with INSERT ... ON
+# CONFLICT DO NOTHING against the unique indexes from the 8b4e2f61c0d7
+# migration, so concurrent submissions cannot create duplicates.
+#----------------------------------------------------------------------------#
+
+def insert_ignore(model):
+  '''
+  INSERT for model that skips rows hitting one of its unique indexes.
+  '''
+  dialect = db.session.get_bind().dialect.name
+  if dialect == 'postgresql':
+    return postgresql.insert(model.__table__).on_conflict_do_nothing()
+  if dialect == 'sqlite':
+    return model.__table__.insert().prefix_with('OR IGNORE')
+  return model.__table__.insert()
+
+def location_ids(pairs):
+  '''
+  Maps each (city, state) pair to a Location id, creating the missing
+  locations in one statement.
+  '''
+  pairs = set(pairs)
+  if not pairs:
+    return dict()
+  query = db.session.query(Location.id, Location.city, Location.state)\
+                    .filter(tuple_(Location.city, Location.state).in_(list(pairs)))
+  ids = {(city, state): id for id, city, state in query}
+  missing = pairs - set(ids)
+  if missing:
+    db.session.execute(insert_ignore(Location), [{'city': city, 'state': state} for city, state in missing])
+    ids.update({(city, state): id for id, city, state in query})
+  return ids
+
+def get_or_create_location(city, state):
+  location = Location.query.filter(Location.city==city, Location.state==state).first()
+  if location is None:
+    location_ids([(city, state)])
+    location = Location.query.filter(Location.city==city, Location.state==state).one()
+  return location
+
+class GenreCache:
+  '''
+  In-process name -> id map of genres. The ids a transaction looks up or
+  creates are held in its session and only cached once it commits: one it
+  read may have been inserted earlier in the same transaction, so after a
+  rollback (of the transaction or a savepoint) they are dropped instead.
+  Deleting genres clears the map.
+  '''
+  def __init__(self):
+    self.ids = dict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    event.listen(Session, 'before_flush', self.before_flush)
+    event.listen(Session, 'after_bulk_delete', self.after_bulk_delete)
+    event.listen(Session, 'after_commit', self.after_commit)
+    event.listen(Session, 'after_rollback', self.discard_pending)
+    event.listen(Session, 'after_transaction_end', self.after_transaction_end)
+
+  def before_flush(self, session, flush_context, instances):
+    if any(isinstance(instance, Genre) for instance in session.deleted):
+      self.clear()
+
+  def after_bulk_delete(self, context):
+    if context.mapper.class_ is Genre:
+      self.clear()
+
+  def after_commit(self, session):
+    # releasing a savepoint commits nothing yet
+    if session.transaction is not None and session.transaction.nested:
+      return
+    pending = session.info.pop(self, None)
+    if pending:
+      with self.lock:
+        self.ids.update(pending)
+
+  def discard_pending(self, session):
+    session.info.pop(self, None)
+
+  def after_transaction_end(self, session, transaction):
+    # a session closed without committing
+    if transaction.parent is None:
+      self.discard_pending(session)
+
+  def clear(self):
+    with self.lock:
+      self.ids.clear()
+
+  def genre_ids(self, names):
+    '''
+    Maps each genre name to a Genre id: cached names cost nothing, the rest
+    are resolved with one IN query and the still missing ones created with
+    one INSERT ... ON CONFLICT DO NOTHING.
+    '''
+    names = set(names)
+    with self.lock:
+      ids = {name: self.ids[name] for name in names if name in self.ids}
+      self.hits += len(ids)
+      self.misses += len(names) - len(ids)
+    missing = names - set(ids)
+    if not missing:
+      return ids
+
+    found = dict(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(missing)))
+    missing -= set(found)
+    if missing:
+      db.session.execute(insert_ignore(Genre), [{'name': name} for name in missing])
+      found.update(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(missing)))
+    db.session.info.setdefault(self, dict()).update(found)
+    ids.update(found)
+    return ids
+
+  def genres(self, names):
+    '''
+    The Genre objects for names, in one query once their ids are known.
+    '''
+    ids = self.genre_ids(names)
+    if not ids:
+      return list()
+    return Genre.query.filter(Genre.id.in_(ids.values())).all()
+
+  def stats(self):
+    with self.lock:
+      return {'hits': self.hits, 'misses': self.misses, 'size': len(self.ids)}
+
+genre_cache = GenreCache()
@@ -0,0 +1,46 @@
+from sqlalchemy import column, func, inspect, literal_column, table
+from models import db
+
+#----------------------------------------------------------------------------#
+# Name search.
+#
+# PostgreSQL answers the ILIKE from the pg_trgm GIN indexes created by the
+# 3f1c0d9a7b52 migration and ranks by similarity(). SQLite uses the FTS5
+# trigram tables from the same migration. Anything else, or a term shorter
+# than one trigram, falls back to a plain ILIKE scan.
+#----------------------------------------------------------------------------#
+
+TRIGRAM_LENGTH = 3
+
+fts_tables = dict()
+
+def fts_table_name(model):
+  return f'{model.__tablename__}_fts'
+
+def has_fts_table(bind, model):
+  key = str(bind.url)
+  if key not in fts_tables:
+    fts_tables[key] = set(inspect(bind).get_table_names())
+  return fts_table_name(model) in fts_tables[key]
+
+def name_search(query, model, search_term):
+  '''
+  Filters query to the rows of model (Venue or Artist) whose name contains
+  search_term, best matches first.
+  '''
+  bind = db.session.get_bind()
+  dialect = bind.dialect.name
+
+  if dialect == 'postgresql':
+    return query.filter(model.name.ilike(f"%{search_term}%"))\
+                .order_by(func.similarity(model.name, search_term).desc(), model.id)
+
+  if dialect == 'sqlite' and len(search_term) >= TRIGRAM_LENGTH and has_fts_table(bind, model):
+    name = fts_table_name(model)
+    fts = table(name, column('rowid'), column('rank'))
+    phrase = '"' + search_term.replace('"', '""') + '"'
+    return query.join(fts, fts.c.rowid == model.id)\
+                .filter(literal_column(f'"{name}"').op('MATCH')(phrase))\
+                .order_by(fts.c.rank, model.id)
+
+  return query.filter(model.name.ilike(f"%{search_term}%")).order_by(model.id)
@@ -0,0 +1,469 @@
+import io
+import json
+import os
+import re
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from flask_migrate import upgrade, downgrade
+from sqlalchemy import event
+
+from app import app
+from models import db, Show, Location, Genre, Venue, Artist, Venue_Genre
+from queries import search_with_upcoming_shows, show_timeline, ShowsPage
+from ingest import ingest, read_records, resolve_ids, IngestError
+from references import genre_cache, location_ids, get_or_create_location
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# plan lines reading a whole table: Postgres "Seq Scan on", SQLite "SCAN"
+# (SQLite's "SEARCH" is an index lookup)
+FULL_SCAN = re.compile(r'Seq Scan on "?(\w+)|^SCAN (?:TABLE )?"?(\w+)')
+
+
+class FyyurTestCase(unittest.TestCase):
+  """This class represents the fyyur test case"""
+
+  def setUp(self):
+    """Define test variables and initialize app."""
+    self.database_name = "fyyur_test"
+    self.database_path = os.environ.get('FYYUR_TEST_DATABASE_URL',
+      "postgresql://{}:{}@{}/{}".format('postgres','password','localhost:5432', self.database_name))
+    app.config['SQLALCHEMY_DATABASE_URI'] = self.database_path
+    app.config['WTF_CSRF_ENABLED'] = False
+    self.client = app.test_client
+
+    self.context = app.app_context()
+    self.context.push()
+    if db.engine.dialect.name == 'postgresql':
+      db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    db.create_all()
+
+    now = datetime.utcnow()
+    location = Location(city='San Francisco', state='CA')
+    jazz, rock = Genre(name='Jazz'), Genre(name='Rock')
+    self.venue = Venue(name='The Musical Hop', location=location, genres=[jazz, rock])
+    self.artist = Artist(name='Guns N Petals', a_location=location, a_genres=[rock])
+    other_venue = Venue(name='Park Square Live', location=location, genres=[jazz])
+    other_artist = Artist(name='Matt Quevedo', a_location=location, a_genres=[jazz])
+    for days in (-30, -1, 1, 30):
+      db.session.add(Show(venue=self.venue, artist=self.artist, start_time=now + timedelta(days=days)))
+      db.session.add(Show(venue=other_venue, artist=other_artist, start_time=now + timedelta(days=days)))
+    db.session.commit()
+
+  def tearDown(self):
+    """Executed after reach test"""
+    db.session.remove()
+    db.drop_all()
+    # its ids belong to the dropped tables
+    genre_cache.clear()
+    self.context.pop()
+
+  def page_statements(self, url, form=None):
+    '''
+    The SELECTs run while rendering url (posting form, if given), with
+    their parameters.
+    '''
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+      if statement.lstrip().upper().startswith('SELECT'):
+        statements.append((statement, parameters))
+
+    db.session.remove()
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+      res = self.client().get(url) if form is None else self.client().post(url, data=form)
+    finally:
+      event.remove(db.engine, 'before_cursor_execute', record)
+    self.assertEqual(res.status_code, 200)
+    self.assertTrue(statements)
+    return statements
+
+  def full_scans(self, statement, parameters):
+    '''
+    Tables statement reads in full. Postgres is told to avoid sequential
+    scans wherever an index can serve, as the planner would pick them on
+    tables this small anyway.
+    '''
+    connection = db.engine.raw_connection()
+    try:
+      cursor = connection.cursor()
+      if db.engine.dialect.name == 'postgresql':
+        cursor.execute('SET enable_seqscan = off')
+        cursor.execute('EXPLAIN ' + statement, parameters)
+        plan = [row[0].strip().lstrip('-> ') for row in cursor.fetchall()]
+      else:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        plan = [row[-1] for row in cursor.fetchall()]
+    finally:
+      connection.rollback()
+      connection.close()
+    return {next(name for name in match.groups() if name)
+            for match in map(FULL_SCAN.search, plan) if match}
+
+  def assert_no_full_scans(self, url):
+    for statement, parameters in self.page_statements(url):
+      self.assertEqual(self.full_scans(statement, parameters), set(), statement)
+
+  def test_venues_statements_independent_of_venue_count(self):
+    # bulk deletes, as deleting a Venue object cascades to its location
+    Show.query.filter(Show.venue_id != self.venue.id).delete(synchronize_session=False)
+    db.session.execute(Venue_Genre.delete().where(Venue_Genre.c.venue_id != self.venue.id))
+    Venue.query.filter(Venue.id != self.venue.id).delete(synchronize_session=False)
+    db.session.commit()
+    self.assertEqual(Venue.query.count(), 1)
+    one_venue = len(self.page_statements('/venues'))
+
+    now = datetime.utcnow()
+    locations = [Location(city='City {}'.format(i), state='CA') for i in range(5)]
+    for i in range(20):
+      venue = Venue(name='Venue {}'.format(i), location=locations[i % 5])
+      db.session.add(Show(venue=venue, artist=self.artist, start_time=now + timedelta(days=i - 10)))
+    db.session.commit()
+    self.assertEqual(Venue.query.count(), 21)
+    self.assertEqual(len(self.page_statements('/venues')), one_venue)
+
+  def test_venue_page_uses_indexes(self):
+    self.assert_no_full_scans('/venues/{}'.format(self.venue.id))
+
+  def test_artist_page_uses_indexes(self):
+    self.assert_no_full_scans('/artists/{}'.format(self.artist.id))
+
+  def test_show_timeline_splits_at_now(self):
+    now = datetime.utcnow()
+    # a show starting now has already started
+    db.session.add(Show(venue=self.venue, artist=self.artist, start_time=now))
+    db.session.commit()
+
+    timeline = show_timeline(Show.venue_id, self.venue.id, Artist, now)
+    self.assertEqual(timeline['past_shows_count'], 3)
+    self.assertEqual(timeline['upcoming_shows_count'], 2)
+    self.assertEqual(len(timeline['past_shows']), 3)
+    self.assertEqual(len(timeline['upcoming_shows']), 2)
+    self.assertEqual(timeline['past_shows'][-1], {'artist_id': self.artist.id,
+                                                  'artist_name': 'Guns N Petals',
+                                                  'artist_image_link': self.artist.image_link,
+                                                  'start_time': str(now)})
+    for shows in (timeline['past_shows'], timeline['upcoming_shows']):
+      start_times = [show['start_time'] for show in shows]
+      self.assertEqual(start_times, sorted(start_times))
+    self.assertTrue(all(show['start_time'] > str(now) for show in timeline['upcoming_shows']))
+
+    timeline = show_timeline(Show.artist_id, self.artist.id, Venue, now)
+    self.assertEqual((timeline['past_shows_count'], timeline['upcoming_shows_count']), (3, 2))
+    self.assertEqual({show['venue_name'] for show in timeline['past_shows'] + timeline['upcoming_shows']},
+                     {'The Musical Hop'})
+
+  def test_search_counts_upcoming_shows_of_matches(self):
+    response = search_with_upcoming_shows(Venue, Show.venue_id, 'Musical')
+    self.assertEqual(response['data'], [{'id': self.venue.id, 'name': 'The Musical Hop', 'num_upcoming_shows': 2}])
+    response = search_with_upcoming_shows(Artist, Show.artist_id, 'Petals')
+    self.assertEqual(response['data'], [{'id': self.artist.id, 'name': 'Guns N Petals', 'num_upcoming_shows': 2}])
+
+    for url in ('/venues/search', '/artists/search'):
+      for statement, parameters in self.page_statements(url, {'search_term': 'Musical'}):
+        self.assertNotIn('Show', self.full_scans(statement, parameters), statement)
+
+  def add_tied_shows(self, count, start_time):
+    '''
+    count shows at the same start_time, each by its own artist, named in
+    the order they are added.
+    '''
+    names = ['Tie {}'.format(i) for i in range(count)]
+    for name in names:
+      artist = Artist(name=name, a_location=self.venue.location)
+      db.session.add(Show(venue=self.venue, artist=artist, start_time=start_time))
+    db.session.commit()
+    return names
+
+  def test_shows_pages_through_equal_start_times(self):
+    names = self.add_tied_shows(7, datetime(2100, 1, 1, 20, 0))
+    start = datetime(2099, 1, 1)
+
+    seen, after = [], None
+    while True:
+      page = ShowsPage(start=start, after=after, per_page=3)
+      seen += [show['artist_name'] for show in page]
+      if page.next_cursor is None:
+        break
+      after = page.next_cursor
+    self.assertEqual(seen, names)
+
+    # and the cursor carried by the page's link
+    res = self.client().get('/shows?from=2099-01-01')
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(res.get_data(as_text=True).count('tile-show'), 7)
+    page = ShowsPage(start=start, per_page=3)
+    list(page)
+    res = self.client().get('/shows?from=2099-01-01&after={}'.format(page.next_cursor))
+    self.assertEqual(re.findall(r'>(Tie \d)<', res.get_data(as_text=True)), names[3:])
+
+  def test_shows_from_and_to(self):
+    names = self.add_tied_shows(2, datetime(2100, 1, 1, 20, 0))
+    later = self.add_tied_shows(1, datetime(2100, 1, 2, 20, 0))
+
+    def listed(query):
+      res = self.client().get('/shows?' + query)
+      self.assertEqual(res.status_code, 200)
+      return re.findall(r'>(Tie \d)<', res.get_data(as_text=True))
+
+    # from is inclusive, to is exclusive
+    self.assertEqual(listed('from=2100-01-01T20:00'), names + later)
+    self.assertEqual(listed('from=2100-01-01T20:00&to=2100-01-02T20:00'), names)
+    self.assertEqual(listed('from=2100-01-01T20:01'), later)
+    self.assertEqual(listed('to=2100-01-01T20:00'), [])
+
+  def test_shows_bad_date(self):
+    for query in ('from=someday', 'to=2100-13-45', 'from=2100-01-01&to=never'):
+      res = self.client().get('/shows?' + query)
+      self.assertEqual(res.status_code, 400, query)
+
+  def test_shows_streamed(self):
+    self.add_tied_shows(3, datetime(2100, 1, 1, 20, 0))
+    app.config['STREAM_SHOWS'] = False
+    try:
+      rendered = self.client().get('/shows')
+    finally:
+      app.config['STREAM_SHOWS'] = True
+    streamed = self.client().get('/shows')
+
+    self.assertEqual(streamed.status_code, 200)
+    # a streamed body has no length up front
+    self.assertNotIn('Content-Length', streamed.headers)
+    self.assertIn('Content-Length', rendered.headers)
+    self.assertEqual(streamed.get_data(as_text=True), rendered.get_data(as_text=True))
+    self.assertEqual(streamed.get_data(as_text=True).count('tile-show'), 11)
+
+  def count_commits(self):
+    commits = []
+    listener = lambda session: commits.append(session)
+    event.listen(db.session, 'after_commit', listener)
+    self.addCleanup(event.remove, db.session, 'after_commit', listener)
+    return commits
+
+  def test_ingest_csv_in_chunks(self):
+    csv = ('name,city,state,address,genres,seeking_talent\n'
+           'Venue 0,San Francisco,CA,1 Main St,Jazz;Blues,yes\n'
+           'Venue 1,Austin,TX,2 Main St,Blues,no\n'
+           'Venue 2,Austin,TX,,,\n'
+           'Venue 3,Boston,MA,,Jazz,\n'
+           'Venue 4,Boston,MA,,,true\n')
+    commits = self.count_commits()
+    report = ingest('venues', read_records(io.StringIO(csv), 'csv'), chunk_size=2)
+    self.assertEqual(report['rows'], 5)
+    self.assertEqual(len(commits), 3)
+
+    venues = {venue.name: venue for venue in Venue.query.filter(Venue.name.like('Venue %'))}
+    self.assertEqual(sorted(venues), ['Venue 0', 'Venue 1', 'Venue 2', 'Venue 3', 'Venue 4'])
+    self.assertEqual(sorted(genre.name for genre in venues['Venue 0'].genres), ['Blues', 'Jazz'])
+    self.assertEqual((venues['Venue 0'].location.city, venues['Venue 0'].location.state), ('San Francisco', 'CA'))
+    self.assertEqual(venues['Venue 0'].location_id, self.venue.location_id)
+    self.assertEqual(venues['Venue 1'].location_id, venues['Venue 2'].location_id)
+    self.assertEqual([venues[name].seeking_talent for name in sorted(venues)], [True, False, False, False, True])
+    # no duplicate references
+    self.assertEqual(Genre.query.filter_by(name='Blues').count(), 1)
+    self.assertEqual(Location.query.filter_by(city='Boston', state='MA').count(), 1)
+
+  def test_ingest_jsonl(self):
+    lines = [{'name': 'Artist {}'.format(i), 'city': 'Austin', 'state': 'TX', 'genres': ['Folk', 'Jazz']}
+             for i in range(3)]
+    jsonl = '\n'.join(json.dumps(line) for line in lines) + '\n\n'
+    report = ingest('artists', read_records(io.StringIO(jsonl), 'jsonl'), chunk_size=2)
+    self.assertEqual(report['rows'], 3)
+
+    artist = Artist.query.filter_by(name='Artist 2').one()
+    self.assertEqual(sorted(genre.name for genre in artist.a_genres), ['Folk', 'Jazz'])
+    self.assertEqual(Genre.query.filter_by(name='Jazz').count(), 1)
+
+    shows = [{'venue_name': 'The Musical Hop', 'artist_name': 'Artist 0', 'start_time': '2100-01-01T20:00'},
+             {'venue_id': self.venue.id, 'artist_id': artist.id, 'start_time': '2100-01-02 20:00'}]
+    jsonl = '\n'.join(json.dumps(show) for show in shows)
+    self.assertEqual(ingest('shows', read_records(io.StringIO(jsonl), 'jsonl'))['rows'], 2)
+    self.assertEqual(Show.query.filter(Show.start_time > datetime(2099, 1, 1)).count(), 2)
+
+  def test_resolve_ids(self):
+    duplicate = Venue(name='The Musical Hop', location=self.venue.location)
+    db.session.add(duplicate)
+    db.session.commit()
+
+    existing, by_name = resolve_ids(Venue, {self.venue.id, duplicate.id, 999}, {'The Musical Hop', 'Nowhere'})
+    self.assertEqual(existing, {self.venue.id, duplicate.id})
+    # a name shared by several rows resolves to the first of them
+    self.assertEqual(by_name, {'The Musical Hop': self.venue.id})
+    self.assertEqual(resolve_ids(Venue, set(), set()), (set(), dict()))
+
+  def test_ingest_unknown_reference(self):
+    shows = ('venue_name,artist_name,start_time\n'
+             'The Musical Hop,Guns N Petals,2100-01-01T20:00\n'
+             'The Musical Hop,Guns N Petals,2100-01-02T20:00\n'
+             'Nowhere,Guns N Petals,2100-01-03T20:00\n')
+    with self.assertRaises(IngestError) as raised:
+      ingest('shows', read_records(io.StringIO(shows), 'csv'), chunk_size=2)
+    self.assertEqual(raised.exception.record, 3)
+    self.assertEqual(raised.exception.message, 'unknown venue')
+    # the chunk before the bad record was committed
+    self.assertEqual(Show.query.filter(Show.start_time > datetime(2099, 1, 1)).count(), 2)
+
+    res = self.client().post('/ingest/shows', content_type='text/csv',
+                             data='venue_name,artist_name,start_time\nNowhere,Guns N Petals,2100-01-03T20:00\n')
+    self.assertEqual(res.status_code, 422)
+    self.assertEqual(res.get_json(), {'success': False, 'error': 'record 1: unknown venue'})
+
+    res = self.client().post('/ingest/shows', data=json.dumps(
+      {'venue_id': self.venue.id, 'artist_id': 999, 'start_time': '2100-01-03T20:00'}), content_type='application/x-ndjson')
+    self.assertEqual(res.status_code, 422)
+    self.assertEqual(res.get_json()['error'], 'record 1: unknown artist')
+
+  def test_ingest_endpoint(self):
+    res = self.client().post('/ingest/venues?chunk_size=1', content_type='text/csv',
+                             data='name,city,state\nVenue 0,Austin,TX\nVenue 1,Austin,TX\n')
+    self.assertEqual(res.status_code, 200)
+    report = res.get_json()
+    self.assertEqual((report['success'], report['kind'], report['rows']), (True, 'venues', 2))
+
+    upload = (io.BytesIO(b'{"name": "Artist 0", "city": "Austin", "state": "TX"}\n'), 'artists.jsonl')
+    res = self.client().post('/ingest/artists', data={'file': upload}, content_type='multipart/form-data')
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(res.get_json()['rows'], 1)
+
+    self.assertEqual(self.client().post('/ingest/genres', data='').status_code, 404)
+    self.assertEqual(Venue.query.filter(Venue.name.like('Venue %')).count(), 2)
+    self.assertEqual(Artist.query.filter_by(name='Artist 0').count(), 1)
+
+  def test_ingest_command(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(os.rmdir, directory)
+    path = os.path.join(directory, 'shows.jsonl')
+    self.addCleanup(os.remove, path)
+    with open(path, 'w', encoding='utf-8') as f:
+      f.write(json.dumps({'venue_name': 'The Musical Hop', 'artist_name': 'Guns N Petals',
+                          'start_time': '2100-01-01T20:00'}) + '\n')
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['ingest', 'shows', path])
+    self.assertEqual(result.exit_code, 0, result.output)
+    self.assertRegex(result.output, r'^shows: 1 rows in ')
+    self.assertEqual(Show.query.filter(Show.start_time > datetime(2099, 1, 1)).count(), 1)
+
+    with open(path, 'w', encoding='utf-8') as f:
+      f.write('venue_name,artist_name,start_time\nNowhere,Guns N Petals,2100-01-01T20:00\n')
+    result = runner.invoke(args=['ingest', 'shows', path, '--format', 'csv'])
+    self.assertEqual(result.exit_code, 1)
+    self.assertIn('record 1: unknown venue', result.output)
+
+  def race_insert(self, table, row):
+    '''
+    Commits row into table from another connection just before the
+    session's next INSERT into table, as a concurrent request would. The
+    returned list is non-empty once it has.
+    '''
+    raced = []
+    def insert_first(conn, cursor, statement, parameters, context, executemany):
+      if not raced and statement.lstrip().upper().startswith('INSERT') and '"{}"'.format(table.name) in statement:
+        raced.append(row)
+        with db.engine.connect() as other:
+          other.execute(table.insert(), row)
+    event.listen(db.engine, 'before_cursor_execute', insert_first)
+    self.addCleanup(event.remove, db.engine, 'before_cursor_execute', insert_first)
+    return raced
+
+  def test_genre_get_or_create(self):
+    jazz = Genre.query.filter_by(name='Jazz').one()
+    ids = genre_cache.genre_ids(['Jazz', 'Blues'])
+    self.assertEqual(ids, {'Jazz': jazz.id, 'Blues': Genre.query.filter_by(name='Blues').one().id})
+
+    # cached once the transaction that looked them up commits
+    hits = genre_cache.stats()['hits']
+    self.assertEqual(genre_cache.genre_ids(['Jazz']), {'Jazz': jazz.id})
+    self.assertEqual(genre_cache.stats()['hits'], hits)
+    db.session.commit()
+    self.assertEqual(genre_cache.genre_ids(['Jazz']), {'Jazz': jazz.id})
+    self.assertEqual(genre_cache.stats()['hits'], hits + 1)
+    self.assertEqual(sorted(genre.name for genre in genre_cache.genres(['Jazz', 'Blues'])), ['Blues', 'Jazz'])
+    self.assertEqual(Genre.query.count(), 3)
+
+  def test_genre_ids_dropped_on_rollback(self):
+    genre_cache.genre_ids(['Blues'])
+    # finds the Blues row inserted just before, in the same transaction
+    genre_cache.genre_ids(['Blues'])
+    db.session.rollback()
+    self.assertEqual(genre_cache.stats()['size'], 0)
+    self.assertEqual(Genre.query.filter_by(name='Blues').count(), 0)
+
+    db.session.begin_nested()
+    genre_cache.genre_ids(['Folk'])
+    db.session.commit()
+    # the savepoint is released, the transaction not committed yet
+    self.assertEqual(genre_cache.stats()['size'], 0)
+    db.session.commit()
+    self.assertEqual(genre_cache.genre_ids(['Folk']), {'Folk': Genre.query.filter_by(name='Folk').one().id})
+    self.assertEqual(genre_cache.stats()['size'], 1)
+
+  def test_genre_created_concurrently(self):
+    raced = self.race_insert(Genre.__table__, {'name': 'Blues'})
+    ids = genre_cache.genre_ids(['Blues', 'Folk'])
+    self.assertTrue(raced)
+    self.assertEqual(Genre.query.filter_by(name='Blues').count(), 1)
+    self.assertEqual(ids, {'Blues': Genre.query.filter_by(name='Blues').one().id,
+                           'Folk': Genre.query.filter_by(name='Folk').one().id})
+
+  def test_location_get_or_create(self):
+    self.assertEqual(get_or_create_location('San Francisco', 'CA').id, self.venue.location_id)
+    austin = get_or_create_location('Austin', 'TX')
+    self.assertEqual(get_or_create_location('Austin', 'TX').id, austin.id)
+    self.assertEqual(Location.query.count(), 2)
+
+  def test_location_created_concurrently(self):
+    raced = self.race_insert(Location.__table__, {'city': 'Austin', 'state': 'TX'})
+    ids = location_ids([('Austin', 'TX'), ('Boston', 'MA'), ('San Francisco', 'CA')])
+    self.assertTrue(raced)
+    self.assertEqual(Location.query.filter_by(city='Austin', state='TX').count(), 1)
+    self.assertEqual(ids, {(location.city, location.state): location.id for location in Location.query})
+    self.assertEqual(len(ids), 3)
+
+  def test_migration_merges_duplicate_references(self):
+    db.session.remove()
+    db.drop_all()
+    upgrade(directory=MIGRATIONS, revision='3f1c0d9a7b52')
+    try:
+      self.check_reference_merge()
+    finally:
+      downgrade(directory=MIGRATIONS, revision='base')
+      db.engine.execute('DROP TABLE IF EXISTS alembic_version')
+
+  def check_reference_merge(self):
+    '''
+    Seeds duplicate genres and locations into the schema as of
+    3f1c0d9a7b52, upgrades to 8b4e2f61c0d7 and checks what it merged.
+    '''
+    # duplicates, as created before the unique indexes
+    seed = [
+      'INSERT INTO "Genre" (id, name) VALUES (1, \'Jazz\'), (2, \'Rock\'), (3, \'Jazz\'), (4, \'Jazz\')',
+      'INSERT INTO "Location" (id, city, state) VALUES (1, \'Austin\', \'TX\'), (2, \'Boston\', \'MA\'), (3, \'Austin\', \'TX\')',
+      'INSERT INTO "Venue" (id, name, location_id) VALUES (1, \'Venue 1\', 3), (2, \'Venue 2\', 2)',
+      'INSERT INTO "Artist" (id, name, location_id) VALUES (1, \'Artist 1\', 1), (2, \'Artist 2\', 3)',
+      # venue 1 is linked to two copies of Jazz, which become one link
+      'INSERT INTO "Venue_Genre" (venue_id, genre_id) VALUES (1, 1), (1, 3), (1, 2), (2, 4)',
+      'INSERT INTO "Artist_Genre" (artist_id, genre_id) VALUES (1, 4), (2, 3), (2, 2)',
+    ]
+    with db.engine.begin() as connection:
+      for statement in seed:
+        connection.execute(statement)
+
+    upgrade(directory=MIGRATIONS, revision='8b4e2f61c0d7')
+
+    rows = lambda statement: sorted(tuple(row) for row in db.engine.execute(statement))
+    self.assertEqual(rows('SELECT id, name FROM "Genre"'), [(1, 'Jazz'), (2, 'Rock')])
+    self.assertEqual(rows('SELECT id, city, state FROM "Location"'), [(1, 'Austin', 'TX'), (2, 'Boston', 'MA')])
+    self.assertEqual(rows('SELECT venue_id, genre_id FROM "Venue_Genre"'), [(1, 1), (1, 2), (2, 1)])
+    self.assertEqual(rows('SELECT artist_id, genre_id FROM "Artist_Genre"'), [(1, 1), (2, 1), (2, 2)])
+    self.assertEqual(rows('SELECT id, location_id FROM "Venue"'), [(1, 1), (2, 2)])
+    self.assertEqual(rows('SELECT id, location_id FROM "Artist"'), [(1, 1), (2, 1)])
+    # and the unique indexes now keep them merged
+    with self.assertRaises(Exception):
+      db.engine.execute('INSERT INTO "Genre" (name) VALUES (\'Jazz\')')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+  unittest.main()
@@ -2,25 +2,81 @@ import os
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
-from models import setup_db, Question, Category
+from sqlalchemy import func, or_, and_
+from fsnd_common.caching import CollectionVersions, conditional
+from fsnd_common.encoding import FastJSONEncoder
+from fsnd_common.compression import init_compression
+from fsnd_common.profiling import init_profiling
+from fsnd_common.metrics import init_metrics, pool_collector, cache_collector, replica_collector
+from fsnd_common.replicas import init_replicas, read_only
+from models import setup_db, db, Question, Category
+from .quiz import random_question, LRUSessionStore, create_quiz_session, next_quiz_question
+from .caching import CategoriesCache
 
 QUESTIONS_PER_PAGE = 10
 
-def paginate_questions(request,selection):
-  page = request.args.get('page',1,type=int)
-  start = (page-1) * QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
+def paginate_questions(request,selection,rank=None):
+  '''
+  Returns one page of formatted questions from the selection query and the
+  cursor of the next one, with the LIMIT/OFFSET pushed down to the database
+  and only the formatted columns read. Passing ?after=<question id> pages by
+  key instead of offset (keyset pagination), which stays cheap however deep
+  the client pages. The selection must be ordered by its key: the question
+  id, or (rank, id) when a rank expression is given, as for search results.
+  The cursor is still the id alone; the rank of that question is read back
+  in a subquery, so it is compared at the precision the database computed
+  it. A malformed cursor is a 400.
+  '''
+  after = request.args.get('after',None)
+  if after is not None:
+    try:
+      after = int(after)
+    except ValueError:
+      abort(400)
+    if rank is None:
+      selection = selection.filter(Question.id>after)
+    else:
+      after_rank = selection.filter(Question.id==after).order_by(None).with_entities(rank).as_scalar()
+      selection = selection.filter(or_(rank>after_rank,
+                                       and_(rank==after_rank,Question.id>after)))
+  else:
+    page = request.args.get('page',1,type=int)
+    selection = selection.offset((page-1) * QUESTIONS_PER_PAGE)
+
+  rows = selection.with_entities(*Question.format_columns()).limit(QUESTIONS_PER_PAGE).all()
+  current_page = [Question.format_row(row) for row in rows]
 
-  questions = [question.format() for question in selection]
-  current_page = questions[start:end]
+  if len(rows) < QUESTIONS_PER_PAGE:
+    return current_page, None
+  return current_page, rows[-1].id
 
-  return current_page
+def count_questions(selection):
+  '''
+  SELECT COUNT(*) over the selection query, without its ordering.
+  '''
+  return selection.order_by(None).with_entities(func.count(Question.id)).scalar()
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  app.json_encoder = FastJSONEncoder
+  if test_config is not None:
+    app.config.update(test_config)
+  # listening before setup_db() installs the versions when its
+  # create_all() creates their table; `flask install-versions` reinstalls them
+  versions = CollectionVersions(db)
+  versions.track('categories', Category)
+  versions.track('questions', Question)
+  versions.listen()
   setup_db(app)
+  init_replicas(app, db)
+  init_compression(app)
+  init_profiling(app)
+  quiz_sessions = app.config.get('QUIZ_SESSION_STORE') or LRUSessionStore()
+
+  categories_cache = CategoriesCache(versions)
+  app.extensions['categories_cache'] = categories_cache
+  init_metrics(app, pool_collector(db), cache_collector('categories', categories_cache.stats), replica_collector(app))
   
   '''
   Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -43,19 +99,16 @@ def create_app(test_config=None):
   for all available categories.
   '''
   @app.route('/categories',methods=['GET'])
+  @conditional(versions,'categories')
   def fetch_categories():
     try:
-      categories=Category.query.all()
-      print(categories)
-
-      #result = [category.format() for category in categories]
-      idCategoryMap = {category.id:category.type for category in categories}
+      idCategoryMap = categories_cache.get()
       return jsonify({"success":True,
      
       "categories": idCategoryMap
     })
     except Exception as e:
-      print(e)
+      app.logger.exception(e)
       abort(404)
 
   ''' 
@@ -70,20 +123,22 @@ def create_app(test_config=None):
   Clicking on the page numbers should update the questions. 
   '''
   @app.route('/questions',methods=['GET'])
+  @conditional(versions,'questions','categories')
   def fetch_questions():
     try:
-       selection = Question.query.all()
-       current_page = paginate_questions(request,selection)
-       categories ={c.id:c.type for c in Category.query.all()}
+       selection = Question.query.order_by(Question.id)
+       current_page, cursor = paginate_questions(request,selection)
+       categories = categories_cache.get()
  
        if len(current_page)==0:
          abort(404)
        return jsonify({"success":True,
-                         "questions":[current for current in current_page],
-                         "totalQuestions":len(selection),"categories":categories,"currentCategory": None
+                         "questions":current_page,
+                         "totalQuestions":count_questions(selection),"categories":categories,"currentCategory": None,
+                         "nextCursor":cursor
                                   })
     except Exception as e:
-      print(e)
+      app.logger.exception(e)
       abort(400)
 
   ''' 
@@ -124,7 +179,7 @@ def create_app(test_config=None):
       
       return jsonify({"success":True,"id":question.id})
     except Exception as e:
-      print(e)
+      app.logger.exception(e)
       abort(400)
 
   '''
@@ -137,16 +192,19 @@ def create_app(test_config=None):
   Try using the word "title" to start. 
   '''
   @app.route('/questions/search',methods=['POST'])
+  @read_only
   def search_question():
     data = request.get_json()
-    searchTerm = data.get('searchTerm')
+    searchTerm = data.get('searchTerm', '')
 
-    questions = Question.query.filter(Question.question.ilike(f'%{searchTerm}%')).all()
+    selection, rank = Question.search(searchTerm)
+    current_page, cursor = paginate_questions(request,selection,rank)
 
     return jsonify({"success":True,
-                    "questions":paginate_questions(request,questions),
-                     "totalQuestions":len(questions),
-                     "currentCategory":None})
+                    "questions":current_page,
+                     "totalQuestions":count_questions(selection),
+                     "currentCategory":None,
+                     "nextCursor":cursor})
   '''
   @TODO: 
   Create a GET endpoint to get questions based on category. 
@@ -156,14 +214,17 @@ def create_app(test_config=None):
   category to be shown. 
   '''
   @app.route('/categories/<int:id>/questions')
+  @conditional(versions,'questions','categories')
   def fetch_questions_of_category(id):
    try:
     category = Category.query.get(id)
-    questions = Question.query.filter(Question.category==str(id)).all()
+    selection = Question.query.filter(Question.category==str(id)).order_by(Question.id)
+    current_page, cursor = paginate_questions(request,selection)
     
     return jsonify({"success":True,
-                      "questions":[question.format() for question in questions],
-                      "totalQuestions":len(questions),"currentCategory": category.type
+                      "questions":current_page,
+                      "totalQuestions":count_questions(selection),"currentCategory": category.type,
+                      "nextCursor":cursor
                               })
    except:
      abort(400)
@@ -180,37 +241,66 @@ def create_app(test_config=None):
   and shown whether they were correct or not. 
   '''
   @app.route('/quizzes',methods=['POST'])
+  @read_only
   def play_quiz():
    
    data = request.get_json()
-   print('data=',data)
+   app.logger.debug('quiz request %s',data)
    
    quiz_category = data.get('quiz_category')
-   id = quiz_category['id']
-   if id == 0:
-    questions = Question.query.all()
-   else:
-    questions = Question.query.filter(Question.category==id).all()
    previous_questions = data.get('previous_questions')
-   remaining_questions = [question.format() for question in questions if question.id not in previous_questions]
-   print(remaining_questions)
-   if len(remaining_questions)>1:
-    print("len=",len(remaining_questions))
-    random_index = random.randint(0,len(remaining_questions)-1)
-    print('--',random_index)
-    question = remaining_questions[random_index]
-    
-   elif len(remaining_questions)==1:
-    question=remaining_questions.pop()
-   else:
-    question = None
+   question = random_question(quiz_category['id'],previous_questions)
+   if question is not None:
+    question = question.format()
    return jsonify({"success":True,
    "previous_question":previous_questions,
    "question":question,
    "quiz_category":quiz_category})
 
   '''
-  @TODO: 
+  Quiz sessions: the server deals a shuffled deck of question ids once,
+  and each following call pops the next question off it, so the client
+  no longer sends previous_questions back on every request.
+  '''
+  @app.route('/quizzes/sessions',methods=['POST'])
+  @read_only
+  def create_quiz():
+    data = request.get_json() or {}
+    quiz_category = data.get('quiz_category')
+    try:
+      category_id = int(quiz_category['id'])
+    except (TypeError, KeyError, ValueError):
+      # no quiz_category, not an object, or no numeric id
+      abort(422)
+
+    session_id, total = create_quiz_session(quiz_sessions,category_id)
+    return jsonify({"success":True,
+    "session_id":session_id,
+    "totalQuestions":total,
+    "quiz_category":quiz_category})
+
+  @app.route('/quizzes/sessions/<session_id>/next',methods=['POST'])
+  @read_only
+  def next_quiz(session_id):
+    try:
+      question = next_quiz_question(quiz_sessions,session_id)
+    except KeyError:
+      abort(404)
+    return jsonify({"success":True,
+    "session_id":session_id,
+    "question":question.format() if question is not None else None})
+
+  '''
+  flask install-versions creates or replaces the collection_versions table
+  and triggers behind the ETags, e.g. on a database restored from
+  trivia.psql or after a collection is tracked on another table.
+  '''
+  @app.cli.command('install-versions')
+  def install_versions_command():
+    versions.install(db.engine)
+
+  '''
+  @TODO:
   Create error handlers for all expected errors 
   including 404 and 422. 
   '''
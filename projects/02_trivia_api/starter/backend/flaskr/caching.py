@@ -0,0 +1,41 @@
+import threading
+from models import Category
+
+'''
+CategoriesCache
+    the {id: type} map of all categories, kept in memory. It is keyed on
+    the 'categories' collection version read from the database, so it is
+    reloaded after any write to categories, from this worker or elsewhere.
+    Without a version (collection versions not installed) it is not
+    cached. Hits and misses are counted for monitoring.
+'''
+class CategoriesCache:
+  def __init__(self, versions):
+    self.versions = versions
+    self.version = None
+    self.categories = None
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+
+  def get(self):
+    version = self.versions.etag('categories')
+    with self.lock:
+      if version is not None and version == self.version:
+        self.hits += 1
+        return self.categories
+      self.misses += 1
+
+    # read the version before loading, so a write racing with the load
+    # leaves a stale version behind and the next call reloads
+    categories = dict(Category.query.with_entities(Category.id, Category.type).order_by(Category.id))
+    with self.lock:
+      self.version = version
+      self.categories = categories
+    return categories
+
+  def stats(self):
+    with self.lock:
+      return {'hits': self.hits,
+              'misses': self.misses,
+              'size': len(self.categories or {})}
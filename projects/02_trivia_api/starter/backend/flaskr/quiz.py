@@ -0,0 +1,149 @@
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from sqlalchemy import func
+from models import Question
+
+QUIZ_SESSION_TTL = 60 * 60
+
+'''
+random_question(category_id, previous_questions)
+    picks a random question of the category (0 for all categories) that is
+    not in previous_questions, or None when there are none left.
+
+    Instead of loading the whole category it counts the unseen questions
+    and reads the one at a random offset in id order, so each of them is
+    equally likely. Both queries run on the (category, id) index; the
+    offset still steps over the index entries before it.
+'''
+def random_question(category_id, previous_questions):
+  query = Question.query
+  if category_id:
+    query = query.filter(Question.category==category_id)
+  if previous_questions:
+    query = query.filter(~Question.id.in_(previous_questions))
+
+  count = query.with_entities(func.count(Question.id)).scalar()
+  if not count:
+    return None
+  return query.order_by(Question.id).offset(random.randrange(count)).first()
+
+'''
+LRUSessionStore
+    in-process store for quiz sessions, implementing the subset of the
+    redis-py client the quiz sessions use (get, set, rpush, lpop, expire,
+    delete). A redis.Redis instance can be used in its place by setting
+    QUIZ_SESSION_STORE in the app config. The least recently used keys are
+    dropped beyond max_keys.
+'''
+class LRUSessionStore:
+  def __init__(self, max_keys=10000):
+    self.max_keys = max_keys
+    self.data = OrderedDict()
+    self.expires = {}
+    self.lock = threading.Lock()
+
+  def _lookup(self, key):
+    expires = self.expires.get(key)
+    if expires is not None and expires <= time.monotonic():
+      self._remove(key)
+    if key not in self.data:
+      return None
+    self.data.move_to_end(key)
+    return self.data[key]
+
+  def _store(self, key, value):
+    self.data[key] = value
+    self.data.move_to_end(key)
+    while len(self.data) > self.max_keys:
+      self._remove(next(iter(self.data)))
+
+  def _remove(self, key):
+    self.data.pop(key, None)
+    self.expires.pop(key, None)
+
+  def get(self, key):
+    with self.lock:
+      return self._lookup(key)
+
+  def set(self, key, value, ex=None):
+    with self.lock:
+      self._remove(key)
+      self._store(key, value)
+      if ex is not None:
+        self.expires[key] = time.monotonic() + ex
+      return True
+
+  def rpush(self, key, *values):
+    with self.lock:
+      deck = self._lookup(key)
+      if deck is None:
+        deck = deque()
+        self._store(key, deck)
+      deck.extend(values)
+      return len(deck)
+
+  def lpop(self, key):
+    with self.lock:
+      deck = self._lookup(key)
+      if not deck:
+        return None
+      value = deck.popleft()
+      if not deck:
+        self._remove(key)
+      return value
+
+  def expire(self, key, seconds):
+    with self.lock:
+      if self._lookup(key) is None:
+        return False
+      self.expires[key] = time.monotonic() + seconds
+      return True
+
+  def delete(self, *keys):
+    with self.lock:
+      removed = 0
+      for key in keys:
+        if self._lookup(key) is not None:
+          removed += 1
+        self._remove(key)
+      return removed
+
+'''
+create_quiz_session(store, category_id, ttl)
+    shuffles the ids of the category's questions (0 for all categories)
+    into a deck kept in the store, and returns (session_id, deck size)
+'''
+def create_quiz_session(store, category_id, ttl=QUIZ_SESSION_TTL):
+  query = Question.query.with_entities(Question.id)
+  if category_id:
+    query = query.filter(Question.category==category_id)
+  deck = [id for id, in query]
+  random.shuffle(deck)
+
+  session_id = uuid.uuid4().hex
+  store.set(f'quiz:{session_id}', category_id, ex=ttl)
+  if deck:
+    store.rpush(f'quiz:{session_id}:deck', *deck)
+    store.expire(f'quiz:{session_id}:deck', ttl)
+  return session_id, len(deck)
+
+'''
+next_quiz_question(store, session_id)
+    pops the next question off the session's deck. Returns the question,
+    None once the deck is used up, and raises KeyError for an unknown or
+    expired session
+'''
+def next_quiz_question(store, session_id):
+  if store.get(f'quiz:{session_id}') is None:
+    raise KeyError(session_id)
+  while True:
+    id = store.lpop(f'quiz:{session_id}:deck')
+    if id is None:
+      return None
+    # questions deleted since the deck was dealt are skipped
+    question = Question.query.get(int(id))
+    if question is not None:
+      return question
@@ -1,6 +1,8 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import logging
+from sqlalchemy import Column, String, Integer, create_engine, column, event, func, literal_column, table
+from sqlalchemy.exc import OperationalError
+from fsnd_common.replicas import RoutingSQLAlchemy
 
 import json
 
@@ -8,13 +10,16 @@ database_url = 'localhost:5432'
 database_name = "trivia"
 database_username = "postgres"
 database_password = "password"
-database_path = "postgres://{}:{}@{}/{}".format(database_username,database_password,database_url, database_name)
+database_path = os.environ.get('DATABASE_URL',
+  "postgres://{}:{}@{}/{}".format(database_username,database_password,database_url, database_name))
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service, at DATABASE_URL
+    when it is set, with the pool settings fsnd_common.engine reads from the
+    environment
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
@@ -22,7 +27,57 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
-    
+    create_indexes()
+
+'''
+create_indexes(connection=None)
+    adds the indexes db.create_all() does not add to an existing database:
+    (category, id) for picking quiz questions, and an index for question
+    search - pg_trgm GIN on PostgreSQL, an FTS5 trigram table kept in sync
+    by triggers on SQLite. Safe to call on every start up, and runs again
+    whenever the questions table is created. The trigram tokenizer needs
+    SQLite 3.34 or later built with FTS5; without it the table is left out
+    and search falls back to LIKE.
+'''
+FTS_TOKENIZER = 'trigram'
+sqlite_fts = False
+
+def create_indexes(connection=None):
+  global sqlite_fts
+  if connection is None:
+    with db.get_engine().begin() as connection:
+      return create_indexes(connection)
+
+  connection.execute('CREATE INDEX IF NOT EXISTS ix_questions_category_id '
+                     'ON questions (category, id)')
+  if connection.dialect.name == 'postgresql':
+    connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    connection.execute('CREATE INDEX IF NOT EXISTS ix_questions_question_trgm '
+                       'ON questions USING gin (question gin_trgm_ops)')
+  elif connection.dialect.name == 'sqlite':
+    triggers = connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    if ('questions_fts_ai',) in triggers:
+      sqlite_fts = True
+      return
+    try:
+      connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+                         "question, content='questions', content_rowid='id', tokenize='{}')".format(FTS_TOKENIZER))
+    except OperationalError as e:
+      logging.getLogger(__name__).warning('question search falls back to LIKE, no FTS5 trigram index: %s', e.orig)
+      sqlite_fts = False
+      return
+    connection.execute("CREATE TRIGGER IF NOT EXISTS questions_fts_ai AFTER INSERT ON questions BEGIN "
+                       "INSERT INTO questions_fts(rowid, question) VALUES (new.id, new.question); END")
+    connection.execute("CREATE TRIGGER IF NOT EXISTS questions_fts_ad AFTER DELETE ON questions BEGIN "
+                       "INSERT INTO questions_fts(questions_fts, rowid, question) "
+                       "VALUES ('delete', old.id, old.question); END")
+    connection.execute("CREATE TRIGGER IF NOT EXISTS questions_fts_au AFTER UPDATE OF question ON questions BEGIN "
+                       "INSERT INTO questions_fts(questions_fts, rowid, question) "
+                       "VALUES ('delete', old.id, old.question); "
+                       "INSERT INTO questions_fts(rowid, question) VALUES (new.id, new.question); END")
+    connection.execute("INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')")
+    sqlite_fts = True
+
 '''
 Question
 
@@ -53,6 +108,30 @@ class Question(db.Model):
     db.session.delete(self)
     db.session.commit()
 
+  '''
+  search(search_term)
+      query of the questions containing search_term (case insensitive),
+      best matches first, and the rank it is ordered by along with the id:
+      lower is better. The rank is None when the matches are ordered by id
+      only.
+  '''
+  @classmethod
+  def search(cls, search_term):
+    query = cls.query
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+      rank = -func.similarity(cls.question, search_term)
+      query = query.filter(cls.question.ilike(f'%{search_term}%'))
+    elif dialect == 'sqlite' and sqlite_fts and len(search_term) >= 3:
+      fts = table('questions_fts', column('rowid'), column('rank'))
+      phrase = '"' + search_term.replace('"', '""') + '"'
+      rank = fts.c.rank
+      query = query.join(fts, fts.c.rowid == cls.id)\
+                   .filter(literal_column('questions_fts').op('MATCH')(phrase))
+    else:
+      return query.filter(cls.question.ilike(f'%{search_term}%')).order_by(cls.id), None
+    return query.order_by(rank, cls.id), rank
+
   def format(self):
     return {
       'id': self.id,
@@ -62,6 +141,29 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+  '''
+  format_columns() and format_row(row)
+      the columns format() reads, and the same dict built from a row of
+      them, for listings that query only those columns instead of loading
+      Question objects
+  '''
+  @classmethod
+  def format_columns(cls):
+    return (cls.id, cls.question, cls.answer, cls.category, cls.difficulty)
+
+  @staticmethod
+  def format_row(row):
+    id, question, answer, category, difficulty = row
+    return {
+      'id': id,
+      'question': question,
+      'answer': answer,
+      'category': category,
+      'difficulty': difficulty
+    }
+
+event.listen(Question.__table__, 'after_create', lambda target, connection, **kw: create_indexes(connection))
+
 '''
 Category
 
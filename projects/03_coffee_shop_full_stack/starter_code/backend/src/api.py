@@ -1,16 +1,29 @@
 import os
 from flask import Flask, request, jsonify, abort
 from sqlalchemy import exc
-import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from fsnd_common.caching import CollectionVersions, conditional
+from fsnd_common.encoding import FastJSONEncoder
+from fsnd_common.compression import init_compression
+from fsnd_common.profiling import init_profiling
+from fsnd_common.metrics import init_metrics, pool_collector, cache_collector
+
+from .database.models import db_drop_and_create_all, setup_db, db, Drink, drinks_short, drinks_long
+from .auth.auth import AuthError, requires_auth, token_cache
 
 app = Flask(__name__)
+app.json_encoder = FastJSONEncoder
 setup_db(app)
+init_compression(app)
+init_profiling(app)
+init_metrics(app, pool_collector(db), cache_collector('tokens', token_cache.stats))
 CORS(app, resources={r"*": {"origins": "*"}})
 
+versions = CollectionVersions(db)
+versions.track('drinks', Drink)
+versions.listen()
+
 '''
 @TODO uncomment the following line to initialize the database
 !! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
@@ -27,14 +40,14 @@ db_drop_and_create_all()
         or appropriate status code indicating reason for failure
 '''
 @app.route('/drinks',methods=['GET'])
+@conditional(versions, 'drinks')
 def fetch_drinks():
     try:
-        drinks = Drink.query.all()
-        print('len:',len(drinks))
+        drinks = drinks_short()
         return jsonify({'success':True,
-                        'drinks': [drink.short() for drink in drinks]}),200
+                        'drinks': drinks}),200
     except Exception as e:
-        print(e)
+        app.logger.exception(e)
         abort(404)
 
 
@@ -51,10 +64,10 @@ def fetch_drinks():
 @requires_auth('get:drinks-detail')
 def fetch_drinks_detail(payload):
     try:
-        drinks = Drink.query.all()
+        drinks = drinks_long()
     except:
         abort(404)
-    return jsonify({'success':True, 'drinks':[drink.long() for drink in drinks]}),200
+    return jsonify({'success':True, 'drinks':drinks}),200
 
 
 '''
@@ -71,13 +84,11 @@ def fetch_drinks_detail(payload):
 def add_drink(payload):
     try:
         data = request.get_json()
-        recipe=data.get('recipe')
-        print(recipe,type(recipe))
-        drink = Drink(title=data.get('title'),recipe=json.dumps(recipe))
+        drink = Drink(title=data.get('title'),recipe=data.get('recipe'))
         drink.insert()
         return jsonify({'success':True,'drinks' : [drink.long()]}),200
     except Exception as e:
-        print(e)
+        app.logger.exception(e)
         abort(400)
 
     
@@ -97,7 +108,6 @@ def add_drink(payload):
 @app.route('/drinks/<int:id>',methods=['PATCH'])
 @requires_auth('patch:drinks')
 def update_drink(payload,id):
-    print(Drink.query.all())
     data=request.get_json()
     try:
         drink=None
@@ -108,10 +118,7 @@ def update_drink(payload,id):
             title = data['title']
             drink.title = title
         if data.get('recipe'):
-            getrecipe = data['recipe']
-            recipe = [getrecipe]
-            recipe = json.dumps(getrecipe)
-            drink.recipe = recipe
+            drink.recipe = data['recipe']
         drink.update()
         drinks = [drink.long()]
         return jsonify({
@@ -119,7 +126,7 @@ def update_drink(payload,id):
             'drinks':drinks
         })
     except Exception as e:
-        print('error',e)
+        app.logger.exception(e)
         abort(500)
 
 
@@ -141,7 +148,7 @@ def delete_drink(payload,id):
         drink.delete()
         return jsonify({"success":True,"delete":id}),200
     except Exception as e:
-        print('delete failed:',e)
+        app.logger.exception('delete failed: %s', e)
         abort(404)
 
 ## Error Handling
@@ -1,4 +1,8 @@
+import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
@@ -8,6 +12,10 @@ from urllib.request import urlopen
 AUTH0_DOMAIN = 'sumesh-fsnd.jp.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'http://localhost:5000'
+JWKS_URL = f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'
+JWKS_TTL = 10 * 60
+JWKS_MIN_REFETCH_INTERVAL = 10
+TOKEN_CACHE_SIZE = 1024
 
 ## AuthError Exception
 '''
@@ -20,6 +28,154 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## JWKS Cache
+'''
+JWKSCache
+process-wide cache of the signing keys published at the jwks url, by kid
+
+    keys are fetched on first use and then refreshed every ttl seconds by a
+    background thread, so verifying a token does no network I/O once warm.
+    a kid that is not cached (Auth0 rotated its keys) triggers one refetch,
+    shared by all the threads asking for it at the same time and at most
+    once every min_refetch_interval seconds, so bogus kids cannot turn into
+    a flood of requests to Auth0.
+'''
+class JWKSCache:
+    def __init__(self, url, ttl=JWKS_TTL, min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL):
+        self.url = url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.keys = {}
+        self.fetched_at = None
+        self.lock = threading.Lock()
+        self.refresher = None
+        self.stopped = threading.Event()
+
+    def fetch(self):
+        jsonurl = urlopen(self.url, timeout=5)
+        jwks = json.loads(jsonurl.read())
+        return {key['kid']: {
+                    'kty': key['kty'],
+                    'kid': key['kid'],
+                    'use': key['use'],
+                    'n': key['n'],
+                    'e': key['e']
+                } for key in jwks['keys']}
+
+    '''
+    refresh(requested_at)
+        refetches the keys unless another thread already did so after
+        requested_at. a failed refetch keeps serving the keys already cached.
+    '''
+    def refresh(self, requested_at=None):
+        if requested_at is None:
+            requested_at = time.monotonic()
+        with self.lock:
+            if self.fetched_at is not None and self.fetched_at >= requested_at:
+                return
+            try:
+                self.keys = self.fetch()
+            except Exception:
+                if not self.keys:
+                    raise AuthError({
+                        'code': 'jwks_unavailable',
+                        'description': 'Unable to fetch the signing keys.'
+                    }, 401)
+            self.fetched_at = time.monotonic()
+
+    def start_background_refresh(self):
+        if self.refresher is not None:
+            return
+        def refresh_forever():
+            while not self.stopped.wait(self.ttl):
+                try:
+                    self.refresh()
+                except AuthError:
+                    pass
+        self.refresher = threading.Thread(target=refresh_forever, daemon=True)
+        self.refresher.start()
+
+    def stop_background_refresh(self):
+        self.stopped.set()
+
+    def get_key(self, kid):
+        now = time.monotonic()
+        if self.fetched_at is None or now - self.fetched_at > self.ttl:
+            self.refresh(now)
+            self.start_background_refresh()
+
+        key = self.keys.get(kid)
+        if key is None and now - self.fetched_at >= self.min_refetch_interval:
+            self.refresh(now)
+            key = self.keys.get(kid)
+        return key
+
+
+jwks_cache = JWKSCache(JWKS_URL)
+
+
+## Verified Token Cache
+'''
+TokenCache
+bounded LRU of verified token payloads, keyed by the sha256 of the token
+
+    each payload is stored with its permissions already turned into a
+    frozenset (None when the token carries no permissions claim), and a hit
+    skips the RS256 signature check. entries are dropped once the
+    token's exp claim has passed, so an expired token always goes back
+    through verify_decode_jwt and gets its token_expired error.
+'''
+class TokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, granted, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return payload, granted
+
+    def put(self, token, payload, granted):
+        if 'exp' not in payload:
+            return
+        key = self.key(token)
+        with self.lock:
+            self.entries[key] = (payload, granted, payload['exp'])
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size': len(self.entries)}
+
+
+token_cache = TokenCache()
+
+
 ## Auth Header
 
 '''
@@ -65,25 +221,85 @@ def get_token_auth_header():
     return token
 
 '''
-check_permissions(permission, payload) method
+token_permissions(payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
         payload: decoded jwt payload
 
     it should raise an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
-    it should raise an AuthError if the requested permission string is not in the payload permissions array
-    return true otherwise
+    return the payload permissions as a frozenset, for constant time lookups
 '''
-def check_permissions(permission, payload):
-    
+def token_permissions(payload):
+
     if 'permissions' not in payload:
         raise AuthError({
             'code': 'invalid_claims',
             'description': 'Permissions not included in the token!'
         }, 400)
 
-    if permission not in payload['permissions']:
+    return frozenset(payload['permissions'])
+
+'''
+compile_permissions(permission) method
+    @INPUTS
+        permission: string permission (i.e. 'post:drink') or an iterable of them
+
+    return the required permissions as a frozenset
+'''
+def compile_permissions(permission):
+    if isinstance(permission, frozenset):
+        return permission
+    if isinstance(permission, str):
+        permission = [permission]
+    return frozenset(p for p in permission if p)
+
+'''
+permitted(required, granted, any_of=False) method
+    @INPUTS
+        required: frozenset of required permissions, from compile_permissions
+        granted: frozenset of token permissions, from token_permissions
+        any_of: whether one of the required permissions is enough
+
+    return whether granted satisfies required
+'''
+def permitted(required, granted, any_of=False):
+    if any_of:
+        return not required or not required.isdisjoint(granted)
+    return required <= granted
+
+'''
+has_permissions(payload, *permissions, any_of=False) method
+    @INPUTS
+        payload: decoded jwt payload
+        permissions: string permissions (i.e. 'post:drink')
+        any_of: whether one of the permissions is enough, rather than all of them
+
+    return True if the payload grants the permissions, False otherwise
+        use check_permissions to raise an AuthError for a missing permission
+        only a payload with no permissions claim at all raises, from token_permissions
+'''
+def has_permissions(payload, *permissions, any_of=False):
+    return permitted(compile_permissions(permissions), token_permissions(payload), any_of)
+
+'''
+check_permissions(permission, payload) method
+    @INPUTS
+        permission: string permission (i.e. 'post:drink') or an iterable of them
+        payload: decoded jwt payload
+        any_of: whether one of the permissions is enough, rather than all of them
+        granted: the token permissions, if already computed by token_permissions
+
+    it should raise an AuthError if permissions are not included in the payload
+        !!NOTE check your RBAC settings in Auth0
+    it should raise an AuthError if the requested permission string is not in the payload permissions array
+    return true otherwise
+'''
+def check_permissions(permission, payload, any_of=False, granted=None):
+
+    if granted is None:
+        granted = token_permissions(payload)
+
+    if not permitted(compile_permissions(permission), granted, any_of):
         raise AuthError({
             'code': 'unauthorized',
             'description': 'Permissions not found!'
@@ -97,7 +313,7 @@ verify_decode_jwt(token) method
         token: a json web token (string)
 
     it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
+    it should verify the token using Auth0 /.well-known/jwks.json (through jwks_cache)
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
@@ -105,29 +321,15 @@ verify_decode_jwt(token) method
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-
-    jwks = json.loads(jsonurl.read())
-
     unverified_header = jwt.get_unverified_header(token)
 
-    rsa_key = {}
-
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_cache.get_key(unverified_header['kid'])
 
     if rsa_key:
 
@@ -165,23 +367,42 @@ def verify_decode_jwt(token):
 
 
 '''
-@requires_auth(permission) decorator method
+verify_decode_jwt_cached(token) method
+    returns (payload, permissions frozenset) of a token verified earlier from
+    token_cache, and verifies and caches it with verify_decode_jwt otherwise
+'''
+def verify_decode_jwt_cached(token):
+    entry = token_cache.get(token)
+    if entry is None:
+        payload = verify_decode_jwt(token)
+        granted = frozenset(payload['permissions']) if 'permissions' in payload else None
+        entry = payload, granted
+        token_cache.put(token, payload, granted)
+    return entry
+
+
+'''
+@requires_auth(*permissions, any_of=False) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permissions: string permissions (i.e. 'post:drink'), all of them required
+        any_of: require only one of the permissions instead
 
     it should use the get_token_auth_header method to get the token
-    it should use the verify_decode_jwt method to decode the jwt
+    it should use the verify_decode_jwt method to decode the jwt (through verify_decode_jwt_cached)
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
-def requires_auth(permission=''):
+def requires_auth(*permissions, any_of=False):
+    required = compile_permissions(permissions)
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload, granted = verify_decode_jwt_cached(token)
+            if granted is None:
+                granted = token_permissions(payload)
+            check_permissions(required, payload, any_of=any_of, granted=granted)
             return f(payload, *args, **kwargs)
 
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
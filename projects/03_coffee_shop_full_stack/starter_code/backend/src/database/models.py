@@ -1,17 +1,20 @@
 import os
-from sqlalchemy import Column, String, Integer
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Column, String, Integer, JSON, inspect, select
+from sqlalchemy.orm import validates
+from fsnd_common.engine import PooledSQLAlchemy
 import json
 
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+database_path = os.environ.get('DATABASE_URL', "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
 
-db = SQLAlchemy()
+db = PooledSQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service, at DATABASE_URL
+    when it is set, with the pool settings fsnd_common.engine reads from the
+    environment
 '''
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
@@ -29,6 +32,50 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+db_migrate_recipe_to_json()
+    converts the recipe column of an existing database from the old
+    String(180) json blob to a native JSON column
+    on SQLite the JSON type is stored as text, so the existing blobs are read
+    as they are and there is nothing to convert
+    then adds the recipe_short column and fills it in for the existing drinks
+'''
+def db_migrate_recipe_to_json():
+    if db.engine.dialect.name == 'postgresql':
+        db.engine.execute('ALTER TABLE drink ALTER COLUMN recipe TYPE JSON USING recipe::json')
+    columns = [column['name'] for column in inspect(db.engine).get_columns('drink')]
+    if 'recipe_short' not in columns:
+        db.engine.execute('ALTER TABLE drink ADD COLUMN recipe_short JSON')
+    drink = Drink.__table__
+    with db.engine.begin() as connection:
+        rows = connection.execute(select([drink.c.id, drink.c.recipe])
+                                  .where(drink.c.recipe_short.is_(None))).fetchall()
+        for id, recipe in rows:
+            connection.execute(drink.update().where(drink.c.id == id)
+                               .values(recipe_short=short_recipe(recipe)))
+
+'''
+short_recipe(recipe)
+    the short form of a recipe, only the color and parts of each ingredient
+'''
+def short_recipe(recipe):
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    return [{'color': r['color'], 'parts': r['parts']} for r in recipe]
+
+'''
+drinks_short() and drinks_long()
+    the short and long forms of all drinks, built straight from
+    (id, title, recipe) rows instead of loading Drink objects
+'''
+def drinks_short():
+    return [{'id': id, 'title': title, 'recipe': recipe}
+            for id, title, recipe in db.session.query(Drink.id, Drink.title, Drink.recipe_short)]
+
+def drinks_long():
+    return [{'id': id, 'title': title, 'recipe': recipe}
+            for id, title, recipe in db.session.query(Drink.id, Drink.title, Drink.recipe)]
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -38,23 +85,31 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
+    # the ingredients, decoded once when the row is loaded
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # a single ingredient dict is stored as a one item list
+    # assign a new list to change it, in place edits are not tracked
+    recipe =  Column(JSON, nullable=False)
+    # short_recipe(recipe), stored along with it whenever recipe is set
+    # so GET /drinks reads it as is
+    recipe_short = Column(JSON, nullable=False)
+
+    @validates('recipe')
+    def validate_recipe(self, key, recipe):
+        if isinstance(recipe, dict):
+            recipe = [recipe]
+        self.recipe_short = short_recipe(recipe)
+        return recipe
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        data=json.loads(self.recipe)
-        print(type(data))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.recipe_short
         }
 
     '''
@@ -65,7 +120,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe
         }
 
     '''
@@ -0,0 +1,77 @@
+import os
+import unittest
+
+from src.auth import auth
+from src.auth.auth import JWKSCache, TokenCache
+from src.database import models
+
+# src.api binds the app to database_path and recreates the tables on import
+models.database_path = os.environ.get('COFFEE_TEST_DATABASE_URL', 'sqlite://')
+from src.api import app
+from src.database.models import Drink, db, db_drop_and_create_all
+
+import test_auth
+
+LATTE = [{'color': 'brown', 'name': 'espresso', 'parts': 1},
+         {'color': 'white', 'name': 'milk', 'parts': 3}]
+WATER = [{'color': 'blue', 'name': 'water', 'parts': 1}]
+
+
+class DrinksTestCase(unittest.TestCase):
+    """This class represents the drinks listing test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = test_auth.SigningKey('key-1')
+
+    def setUp(self):
+        self.server = test_auth.JWKSServer([self.key])
+        self.original_caches = auth.jwks_cache, auth.token_cache
+        auth.jwks_cache = JWKSCache(self.server.url)
+        auth.token_cache = TokenCache()
+
+        with app.app_context():
+            db_drop_and_create_all()
+            for title, recipe in (('Latte', LATTE), ('Water', WATER)):
+                Drink(title=title, recipe=recipe).insert()
+        self.client = app.test_client
+
+    def tearDown(self):
+        auth.jwks_cache.stop_background_refresh()
+        auth.jwks_cache, auth.token_cache = self.original_caches
+        self.server.close()
+        with app.app_context():
+            db.session.remove()
+
+    def test_drinks_short_form(self):
+        response = self.client().get('/drinks')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            'success': True,
+            'drinks': [
+                {'id': 1, 'title': 'Latte',
+                 'recipe': [{'color': 'brown', 'parts': 1}, {'color': 'white', 'parts': 3}]},
+                {'id': 2, 'title': 'Water', 'recipe': [{'color': 'blue', 'parts': 1}]},
+            ],
+        })
+
+    def test_drinks_detail_long_form(self):
+        token = self.key.token(permissions=['get:drinks-detail'])
+        response = self.client().get('/drinks-detail',
+                                     headers={'Authorization': 'Bearer ' + token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {
+            'success': True,
+            'drinks': [
+                {'id': 1, 'title': 'Latte', 'recipe': LATTE},
+                {'id': 2, 'title': 'Water', 'recipe': WATER},
+            ],
+        })
+
+    def test_drinks_detail_requires_token(self):
+        response = self.client().get('/drinks-detail')
+        self.assertEqual(response.status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
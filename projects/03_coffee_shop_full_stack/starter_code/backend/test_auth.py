@@ -0,0 +1,256 @@
+import base64
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from unittest import mock
+
+from Crypto.PublicKey import RSA
+from flask import Flask
+from jose import jwt
+
+from src.auth import auth
+from src.auth.auth import (AuthError, JWKSCache, TokenCache, check_permissions,
+                           has_permissions, requires_auth, verify_decode_jwt)
+
+
+def b64(number):
+    data = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+class SigningKey:
+    """An RSA key pair standing in for one of the Auth0 tenant keys"""
+
+    def __init__(self, kid):
+        self.kid = kid
+        self.key = RSA.generate(2048)
+        self.pem = self.key.export_key().decode()
+
+    def jwk(self):
+        return {'kty': 'RSA', 'kid': self.kid, 'use': 'sig',
+                'n': b64(self.key.n), 'e': b64(self.key.e)}
+
+    def token(self, permissions=(), expires_in=3600):
+        claims = {
+            'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+            'aud': auth.API_AUDIENCE,
+            'sub': 'auth0|test',
+            'iat': int(time.time()),
+            'exp': int(time.time()) + expires_in,
+            'permissions': list(permissions),
+        }
+        return jwt.encode(claims, self.pem, algorithm='RS256',
+                          headers={'kid': self.kid})
+
+
+class JWKSServer:
+    """Local stand-in for https://<AUTH0_DOMAIN>/.well-known/jwks.json"""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.hits = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits += 1
+                body = json.dumps({'keys': [k.jwk() for k in server.keys]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.httpd.server_port)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the JWKS cache test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = SigningKey('key-1')
+        cls.rotated_key = SigningKey('key-2')
+
+    def setUp(self):
+        self.server = JWKSServer([self.key])
+        self.original_cache = auth.jwks_cache
+        auth.jwks_cache = JWKSCache(self.server.url, min_refetch_interval=0)
+
+    def tearDown(self):
+        auth.jwks_cache.stop_background_refresh()
+        auth.jwks_cache = self.original_cache
+        self.server.close()
+
+    def test_keys_fetched_once(self):
+        token = self.key.token()
+        for i in range(5):
+            payload = verify_decode_jwt(token)
+        self.assertEqual(payload['sub'], 'auth0|test')
+        self.assertEqual(self.server.hits, 1)
+
+    def test_unknown_kid_refetches_after_rotation(self):
+        verify_decode_jwt(self.key.token())
+        self.server.keys = [self.key, self.rotated_key]
+
+        payload = verify_decode_jwt(self.rotated_key.token())
+        self.assertEqual(payload['sub'], 'auth0|test')
+        self.assertEqual(self.server.hits, 2)
+
+    def test_unknown_kid_refetch_is_single_flight(self):
+        verify_decode_jwt(self.key.token())
+        self.server.keys = [self.key, self.rotated_key]
+        token = self.rotated_key.token()
+
+        errors = []
+        def verify():
+            try:
+                verify_decode_jwt(token)
+            except AuthError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=verify) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.server.hits, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        auth.jwks_cache.min_refetch_interval = 60
+        verify_decode_jwt(self.key.token())
+        for i in range(3):
+            with self.assertRaises(AuthError):
+                verify_decode_jwt(self.rotated_key.token())
+        self.assertEqual(self.server.hits, 1)
+
+    def test_keys_refetched_after_ttl(self):
+        auth.jwks_cache.ttl = 0.05
+        verify_decode_jwt(self.key.token())
+        time.sleep(0.2)
+        verify_decode_jwt(self.key.token())
+        self.assertGreaterEqual(self.server.hits, 2)
+
+    def test_stale_keys_served_when_jwks_unreachable(self):
+        auth.jwks_cache.ttl = 0.05
+        verify_decode_jwt(self.key.token())
+        self.server.close()
+        time.sleep(0.1)
+        payload = verify_decode_jwt(self.key.token())
+        self.assertEqual(payload['sub'], 'auth0|test')
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = SigningKey('key-1')
+
+    def setUp(self):
+        self.server = JWKSServer([self.key])
+        self.original_caches = auth.jwks_cache, auth.token_cache
+        auth.jwks_cache = JWKSCache(self.server.url)
+        auth.token_cache = TokenCache(maxsize=2)
+
+        self.app = Flask(__name__)
+
+        @self.app.route('/drinks-detail')
+        @requires_auth('get:drinks-detail')
+        def drinks_detail(payload):
+            return payload['sub']
+
+        @self.app.route('/drinks', methods=['POST'])
+        @requires_auth('post:drinks', 'patch:drinks')
+        def drinks_post(payload):
+            return payload['sub']
+
+        @self.app.route('/drinks', methods=['DELETE'])
+        @requires_auth('delete:drinks', 'manage:drinks', any_of=True)
+        def drinks_delete(payload):
+            return payload['sub']
+
+        @self.app.errorhandler(AuthError)
+        def not_authenticated(auth_error):
+            return auth_error.error['code'], auth_error.status_code
+
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        auth.jwks_cache.stop_background_refresh()
+        auth.jwks_cache, auth.token_cache = self.original_caches
+        self.server.close()
+
+    def get(self, token):
+        return self.client().get('/drinks-detail',
+                                 headers={'Authorization': 'Bearer ' + token})
+
+    def test_repeat_token_skips_verification(self):
+        token = self.key.token(['get:drinks-detail'])
+        with mock.patch.object(auth.jwt, 'decode', wraps=jwt.decode) as decode:
+            for i in range(3):
+                response = self.get(token)
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_cached_token_still_checks_permissions(self):
+        token = self.key.token(['post:drinks'])
+        self.assertEqual(self.get(token).status_code, 403)
+        self.assertEqual(self.get(token).status_code, 403)
+
+    def test_expired_token_evicted(self):
+        token = self.key.token(['get:drinks-detail'], expires_in=1)
+        self.assertEqual(self.get(token).status_code, 200)
+        time.sleep(2)
+        response = self.get(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data, b'token_expired')
+
+    def test_all_of_permissions(self):
+        headers = {'Authorization': 'Bearer ' + self.key.token(['post:drinks'])}
+        self.assertEqual(self.client().post('/drinks', headers=headers).status_code, 403)
+        headers = {'Authorization': 'Bearer ' + self.key.token(['post:drinks', 'patch:drinks'])}
+        self.assertEqual(self.client().post('/drinks', headers=headers).status_code, 200)
+
+    def test_any_of_permissions(self):
+        headers = {'Authorization': 'Bearer ' + self.key.token(['get:drinks-detail'])}
+        self.assertEqual(self.client().delete('/drinks', headers=headers).status_code, 403)
+        headers = {'Authorization': 'Bearer ' + self.key.token(['manage:drinks'])}
+        self.assertEqual(self.client().delete('/drinks', headers=headers).status_code, 200)
+
+    def test_permission_check_api(self):
+        payload = {'permissions': ['perm:%d' % i for i in range(500)]}
+        self.assertTrue(has_permissions(payload, 'perm:1', 'perm:499'))
+        self.assertFalse(has_permissions(payload, 'perm:1', 'perm:500'))
+        self.assertTrue(has_permissions(payload, 'perm:1', 'perm:500', any_of=True))
+        self.assertTrue(check_permissions('perm:250', payload))
+        with self.assertRaises(AuthError) as raised:
+            check_permissions(['perm:1', 'perm:500'], payload)
+        self.assertEqual(raised.exception.status_code, 403)
+        with self.assertRaises(AuthError) as raised:
+            has_permissions({}, 'perm:1')
+        self.assertEqual(raised.exception.status_code, 400)
+
+    def test_cache_is_bounded(self):
+        tokens = [self.key.token(['get:drinks-detail'], expires_in=3600 + i) for i in range(3)]
+        for token in tokens:
+            self.get(token)
+        self.assertEqual(len(auth.token_cache.entries), 2)
+        self.assertIsNone(auth.token_cache.get(tokens[0]))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from flask import Flask
+
+from src.database import models
+from src.database.models import (Drink, db, db_migrate_recipe_to_json,
+                                 drinks_long, drinks_short, setup_db)
+
+LATTE = [{'color': 'brown', 'name': 'espresso', 'parts': 1},
+         {'color': 'white', 'name': 'milk', 'parts': 3}]
+LATTE_SHORT = [{'color': 'brown', 'parts': 1}, {'color': 'white', 'parts': 3}]
+WATER = {'color': 'blue', 'name': 'water', 'parts': 1}
+
+
+class DrinkTestCase(unittest.TestCase):
+    """This class represents the Drink model test case"""
+
+    def setUp(self):
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        self.app = Flask(__name__)
+        with mock.patch.object(models, 'database_path', 'sqlite:///' + path):
+            setup_db(self.app)
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.get_engine().dispose()
+
+    def test_single_ingredient_recipe_is_a_list(self):
+        drink = Drink(title='Water', recipe=WATER)
+        self.assertEqual(drink.recipe, [WATER])
+        self.assertEqual(drink.short()['recipe'], [{'color': 'blue', 'parts': 1}])
+
+    def test_short_recipe_stored_with_recipe(self):
+        drink = Drink(title='Latte', recipe=LATTE)
+        drink.insert()
+        self.assertEqual(db.session.query(Drink.recipe_short).scalar(), LATTE_SHORT)
+        self.assertEqual(drinks_short(), [{'id': drink.id, 'title': 'Latte', 'recipe': LATTE_SHORT}])
+
+        drink.recipe = [WATER]
+        drink.update()
+        db.session.expire_all()
+        self.assertEqual(drinks_short()[0]['recipe'], [{'color': 'blue', 'parts': 1}])
+        self.assertEqual(drinks_long()[0]['recipe'], [WATER])
+        self.assertEqual(Drink.query.one().short()['recipe'], [{'color': 'blue', 'parts': 1}])
+
+    def test_migrate_recipe_to_json(self):
+        # the drink table as it was, with the recipe as a String(180) blob
+        db.engine.execute('DROP TABLE drink')
+        db.engine.execute('CREATE TABLE drink (id INTEGER PRIMARY KEY, title VARCHAR(80) UNIQUE, '
+                          'recipe VARCHAR(180) NOT NULL)')
+        db.engine.execute('INSERT INTO drink (title, recipe) VALUES (?, ?), (?, ?)',
+                          'Latte', json.dumps(LATTE), 'Water', json.dumps(WATER))
+
+        db_migrate_recipe_to_json()
+        expected = [{'id': 1, 'title': 'Latte', 'recipe': LATTE_SHORT},
+                    {'id': 2, 'title': 'Water', 'recipe': [{'color': 'blue', 'parts': 1}]}]
+        self.assertEqual(drinks_short(), expected)
+        self.assertEqual(drinks_long()[0]['recipe'], LATTE)
+
+        # running it again changes nothing
+        db_migrate_recipe_to_json()
+        self.assertEqual(drinks_short(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+"""Coffee shop endpoint benchmarks. Tokens are signed with a key generated
+here and published by a local JWKS server, so the authenticated endpoints
+go through the real RS256 verification without reaching Auth0."""
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from harness import Endpoint, SEED, main, timeit, use_app_dir
+
+use_app_dir('03_coffee_shop_full_stack', 'starter_code', 'backend')
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+from src.auth import auth
+from src.database import models
+
+KID = 'benchmark'
+PERMISSIONS = ('get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks')
+COLORS = ('#1f1209', '#c8a27c', '#f5e6d3', '#6f4e37', '#ffffff', '#3b2a1e')
+INGREDIENTS = ('espresso', 'milk', 'foam', 'water', 'chocolate', 'cream')
+CHUNK_SIZE = 10000
+
+
+def b64(number):
+    data = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+class SigningKey:
+    """An RSA key pair standing in for the Auth0 tenant's, with a local
+    server publishing it the way https://<AUTH0_DOMAIN>/.well-known/jwks.json
+    does."""
+
+    def __init__(self):
+        self.key = RSA.generate(2048)
+        self.pem = self.key.export_key().decode()
+        jwks = json.dumps({'keys': [{'kty': 'RSA', 'kid': KID, 'use': 'sig',
+                                     'n': b64(self.key.n), 'e': b64(self.key.e)}]}).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(jwks)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.httpd.server_port)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def token(self, permissions=PERMISSIONS, expires_in=24 * 3600):
+        claims = {'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+                  'aud': auth.API_AUDIENCE,
+                  'sub': 'auth0|benchmark',
+                  'iat': int(time.time()),
+                  'exp': int(time.time()) + expires_in,
+                  'permissions': list(permissions)}
+        return jwt.encode(claims, self.pem, algorithm='RS256', headers={'kid': KID})
+
+
+signing_key = None
+
+
+def recipe(rng):
+    return [{'color': rng.choice(COLORS), 'name': rng.choice(INGREDIENTS), 'parts': rng.randint(1, 4)}
+            for _ in range(rng.randint(1, 4))]
+
+
+def setup(url, size):
+    global signing_key
+    signing_key = SigningKey()
+    auth.jwks_cache.url = signing_key.url
+    # src.api binds the app to database_path and recreates the tables on import
+    models.database_path = url
+    from src.api import app
+
+    rng = random.Random(SEED)
+    with app.app_context():
+        for start in range(0, size, CHUNK_SIZE):
+            recipes = [recipe(rng) for _ in range(start, min(start + CHUNK_SIZE, size))]
+            models.db.session.execute(models.Drink.__table__.insert(), [
+                {'title': 'Drink {}'.format(start + i), 'recipe': r, 'recipe_short': models.short_recipe(r)}
+                for i, r in enumerate(recipes)])
+        models.db.session.commit()
+        models.db.session.remove()
+    return app
+
+
+def endpoints(app, size):
+    headers = {'Authorization': 'Bearer ' + signing_key.token()}
+    new_drink = lambda i: size + 1 + i
+    rng = random.Random(SEED)
+    return [
+        Endpoint('GET', '/drinks'),
+        Endpoint('GET', '/drinks-detail', headers=headers),
+        Endpoint('POST', '/drinks', headers=headers,
+                 json=lambda i: {'title': 'Benchmark drink {}'.format(i), 'recipe': recipe(rng)}),
+        Endpoint('PATCH', lambda i: '/drinks/{}'.format(new_drink(i)), headers=headers,
+                 json=lambda i: {'title': 'Benchmark drink {} (edited)'.format(i)},
+                 name='PATCH /drinks/<id>'),
+        Endpoint('DELETE', lambda i: '/drinks/{}'.format(new_drink(i)), headers=headers,
+                 name='DELETE /drinks/<id>'),
+        Endpoint('GET', '/metrics'),
+    ]
+
+
+def token_benchmark(repeat):
+    """Verifying a token: the RS256 signature check every time, against
+    the token cache's lookup once it has been verified."""
+    token = signing_key.token()
+    auth.token_cache.clear()
+    auth.verify_decode_jwt_cached(token)
+    return {'verify': timeit(lambda: auth.verify_decode_jwt(token), repeat),
+            'cached': timeit(lambda: auth.verify_decode_jwt_cached(token), repeat)}
+
+
+def permission_benchmark(repeat, calls=100):
+    """calls permission checks of a token granting more and more
+    permissions, for 1 and 10 required ones: building the token's
+    frozenset on every check, against the one the token cache keeps."""
+    results = {}
+    for granted in (10, 100, 1000):
+        payload = {'permissions': ['do:thing-{}'.format(i) for i in range(granted)]}
+        permissions = auth.token_permissions(payload)
+        result = {}
+        for required in (1, 10):
+            needed = auth.compile_permissions(payload['permissions'][-required:])
+            check = lambda: [auth.check_permissions(needed, payload) for _ in range(calls)]
+            check_cached = lambda: [auth.check_permissions(needed, payload, granted=permissions)
+                                    for _ in range(calls)]
+            result['require_{}'.format(required)] = {'per_token': timeit(check, repeat),
+                                                     'cached': timeit(check_cached, repeat)}
+        results[str(granted)] = result
+    results['calls'] = calls
+    return results
+
+
+def micro(app, size):
+    return {'token_verification': token_benchmark(100),
+            'permission_checks': permission_benchmark(20)}
+
+
+if __name__ == '__main__':
+    main('coffee', setup, endpoints, micro)
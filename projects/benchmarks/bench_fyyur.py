@@ -0,0 +1,168 @@
+"""Fyyur endpoint benchmarks: venues, artists and shows seeded through the
+bulk ingestion path, the schema built by the app's own migrations (so
+SQLite gets the FTS5 search tables and PostgreSQL the pg_trgm indexes)."""
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+from harness import Endpoint, SEED, drive_client, main, timeit, use_app_dir
+
+FYYUR_DIR = use_app_dir('01_fyyur', 'starter_code')
+
+from flask_migrate import upgrade
+from app import app
+from ingest import ingest
+from models import db, Location, Venue
+from search import name_search
+
+STATES = ('NY', 'CA', 'TX', 'IL', 'WA', 'LA', 'MA', 'FL')
+GENRES = ('Jazz', 'Rock n Roll', 'Blues', 'Folk', 'Hip-Hop', 'Classical',
+          'Country', 'Electronic', 'Funk', 'Soul', 'Pop', 'Reggae')
+ADJECTIVES = ('Blue', 'Velvet', 'Golden', 'Electric', 'Hidden', 'Royal',
+              'Silver', 'Little', 'Midnight', 'Crimson')
+VENUE_NOUNS = ('Lounge', 'Hall', 'Cellar', 'Garden', 'Theatre', 'Room',
+               'Loft', 'Stage', 'Club', 'Tavern')
+ARTIST_NOUNS = ('Band', 'Quartet', 'Collective', 'Trio', 'Orchestra',
+                'Choir', 'Ensemble', 'Brothers', 'Sisters', 'Project')
+SEARCH_TERMS = ('Lounge', 'Velvet Lounge', 'Lounge 12', 'no such venue')
+
+
+def counts(size):
+    """Rows per table for a dataset of size shows."""
+    return {'shows': size,
+            'venues': max(size // 10, 10),
+            'artists': max(size // 10, 10),
+            'locations': max(size // 100, 5)}
+
+
+def profile(rng, i, nouns, locations):
+    return {'name': '{} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(nouns), i),
+            'city': 'City {}'.format(i % locations),
+            'state': STATES[i % locations % len(STATES)],
+            'address': '{} Main St'.format(i),
+            'phone': '555-{:03d}-{:04d}'.format(i % 1000, i % 10000),
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'facebook_link': 'https://www.facebook.com/{}'.format(i),
+            'website_link': 'https://example.com/{}'.format(i),
+            'seeking_talent': i % 3 == 0,
+            'seeking_venue': i % 4 == 0,
+            'seeking_description': 'Looking for a good time' if i % 3 == 0 else None}
+
+
+def seed(size):
+    rng = random.Random(SEED)
+    n = counts(size)
+    now = datetime.utcnow()
+    ingest('venues', (profile(rng, i, VENUE_NOUNS, n['locations'])
+                          for i in range(n['venues'])), 1000)
+    ingest('artists', (profile(rng, i, ARTIST_NOUNS, n['locations'])
+                           for i in range(n['artists'])), 1000)
+    ingest('shows', ({'venue_id': rng.randint(1, n['venues']),
+                          'artist_id': rng.randint(1, n['artists']),
+                          'start_time': (now + timedelta(days=rng.uniform(-365, 365))).isoformat()}
+                         for i in range(n['shows'])), 1000)
+    db.session.remove()
+
+
+def setup(url, size):
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        upgrade(directory=os.path.join(FYYUR_DIR, 'migrations'))
+        seed(size)
+    return app
+
+
+def venue_form(i):
+    return {'name': 'Bench Venue {}'.format(i), 'city': 'Bench City {}'.format(i), 'state': 'NY',
+            'address': '1 Bench St', 'phone': '555-000-0000', 'genres': ['Jazz', 'Blues'],
+            'facebook_link': 'https://www.facebook.com/bench', 'website_link': 'https://example.com',
+            'image_link': 'https://example.com/bench.jpg',
+            'seeking_talent': 'y', 'seeking_description': 'Benchmarking'}
+
+
+def artist_form(i):
+    return dict(venue_form(i), name='Bench Artist {}'.format(i), seeking_venue='y')
+
+
+def endpoints(app, size):
+    n = counts(size)
+    # spread the detail pages over the dataset; new rows take the ids
+    # after the seeded ones, and the venues created here are the ones
+    # deleted again (each has a city of its own, which the delete cascades to)
+    venue = lambda i: i * 7919 % n['venues'] + 1
+    artist = lambda i: i * 7919 % n['artists'] + 1
+    new_venue = lambda i: n['venues'] + 1 + i
+    new_artist = lambda i: n['artists'] + 1 + i
+    shows = lambda i: '\n'.join(json.dumps({'venue_id': venue(i + j), 'artist_id': artist(i + j),
+                                            'start_time': '2030-01-01T20:00:00'}) for j in range(10))
+    return [
+        Endpoint('GET', '/'),
+        Endpoint('GET', '/venues'),
+        Endpoint('POST', '/venues/search', data={'search_term': 'Lounge'}, read_only=True),
+        Endpoint('GET', lambda i: '/venues/{}'.format(venue(i)), name='GET /venues/<id>'),
+        Endpoint('GET', '/venues/create'),
+        Endpoint('POST', '/venues/create', data=venue_form, status=302),
+        Endpoint('GET', lambda i: '/venues/{}/edit'.format(venue(i)), name='GET /venues/<id>/edit'),
+        Endpoint('POST', lambda i: '/venues/{}/edit'.format(new_venue(i)), data=venue_form,
+                 status=302, name='POST /venues/<id>/edit'),
+        Endpoint('DELETE', lambda i: '/venues/{}'.format(new_venue(i)), name='DELETE /venues/<id>'),
+        Endpoint('GET', '/artists'),
+        Endpoint('POST', '/artists/search', data={'search_term': 'Band'}, read_only=True),
+        Endpoint('GET', lambda i: '/artists/{}'.format(artist(i)), name='GET /artists/<id>'),
+        Endpoint('GET', '/artists/create'),
+        Endpoint('POST', '/artists/create', data=artist_form, status=302),
+        Endpoint('GET', lambda i: '/artists/{}/edit'.format(artist(i)), name='GET /artists/<id>/edit'),
+        Endpoint('POST', lambda i: '/artists/{}/edit'.format(new_artist(i)), data=artist_form,
+                 status=302, name='POST /artists/<id>/edit'),
+        Endpoint('GET', '/shows'),
+        Endpoint('GET', '/shows?from=2000-01-01', name='GET /shows?from'),
+        Endpoint('GET', '/shows/create'),
+        Endpoint('POST', '/shows/create', data=lambda i: {'venue_id': venue(i), 'artist_id': artist(i),
+                                                         'start_time': '2030-01-01 20:00:00'}),
+        Endpoint('POST', '/ingest/shows', body=shows, headers={'Content-Type': 'application/x-ndjson'}),
+        Endpoint('GET', '/metrics'),
+    ]
+
+
+def search_benchmark(repeat):
+    """Name search through the FTS5/pg_trgm index against a plain ILIKE
+    scan, for terms matching many, few and no venues."""
+    results = {}
+    with app.app_context():
+        for term in SEARCH_TERMS:
+            indexed = lambda: name_search(Venue.query, Venue, term).all()
+            scan = lambda: Venue.query.filter(Venue.name.ilike('%{}%'.format(term))).order_by(Venue.id).all()
+            results[term] = {'rows': len(indexed()),
+                             'indexed': timeit(indexed, repeat),
+                             'ilike': timeit(scan, repeat)}
+        db.session.remove()
+    return results
+
+
+def directory_benchmark(size, iterations):
+    """Statements and latency of GET /venues as the number of locations
+    doubles: the count should not grow with them."""
+    results = {}
+    rng = random.Random(SEED)
+    for step in range(3):
+        with app.app_context():
+            locations = Location.query.count()
+            venues = Venue.query.count()
+        results[str(locations)] = drive_client(app, [Endpoint('GET', '/venues')], iterations, 1)['GET /venues']
+        with app.app_context():
+            new = (dict(profile(rng, venues + i, VENUE_NOUNS, locations), city='Growth City {}.{}'.format(step, i))
+                   for i in range(locations))
+            ingest('venues', new, 1000)
+            db.session.remove()
+    return results
+
+
+def micro(app, size):
+    return {'name_search': search_benchmark(10),
+            'venue_directory_growth': directory_benchmark(size, 10)}
+
+
+if __name__ == '__main__':
+    main('fyyur', setup, endpoints, micro)
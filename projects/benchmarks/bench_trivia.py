@@ -0,0 +1,160 @@
+"""Trivia endpoint benchmarks, plus the quiz, projection, JSON encoding and
+compression measurements that back the optimizations of those paths."""
+import functools
+import json
+import random
+import tracemalloc
+
+from harness import Endpoint, SEED, drive_client, main, timeit, use_app_dir
+
+use_app_dir('02_trivia_api', 'starter', 'backend')
+
+import flaskr
+import models
+from flask import json as flask_json
+from fsnd_common.compression import brotli, compress
+from fsnd_common.encoding import orjson
+from models import db, Question, Category
+
+CATEGORIES = ('Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports')
+TEMPLATES = ('What is the capital of country number {}?',
+             'Who painted masterpiece number {}?',
+             'In which year did event number {} happen?',
+             'How many players are on team number {}?',
+             'Which element has atomic mass {}?')
+CHUNK_SIZE = 10000
+
+
+def seed(size):
+    rng = random.Random(SEED)
+    db.session.execute(Category.__table__.insert(),
+                       [{'id': id, 'type': type} for id, type in enumerate(CATEGORIES, start=1)])
+    for start in range(0, size, CHUNK_SIZE):
+        db.session.execute(Question.__table__.insert(), [
+            {'question': rng.choice(TEMPLATES).format(i),
+             'answer': 'Answer {}'.format(i),
+             'category': rng.randint(1, len(CATEGORIES)),
+             'difficulty': rng.randint(1, 5)}
+            for i in range(start, min(start + CHUNK_SIZE, size))])
+    db.session.commit()
+    db.session.remove()
+
+
+def setup(url, size):
+    # setup_db's database_path default is bound when models is imported
+    flaskr.setup_db = functools.partial(models.setup_db, database_path=url)
+    app = flaskr.create_app()
+    with app.app_context():
+        seed(size)
+    return app
+
+
+def endpoints(app, size):
+    question = lambda i: i * 7919 % size + 1
+    new_question = lambda i: size + 1 + i
+    client = app.test_client(use_cookies=False)
+    session_id = client.post('/quizzes/sessions', json={'quiz_category': {'id': 0}}).get_json()['session_id']
+    return [
+        Endpoint('GET', '/categories'),
+        Endpoint('GET', '/questions'),
+        Endpoint('GET', '/questions?page={}'.format(max(size // 20, 1)), name='GET /questions?page'),
+        Endpoint('GET', lambda i: '/questions?after={}'.format(question(i)), name='GET /questions?after'),
+        Endpoint('GET', lambda i: '/categories/{}/questions'.format(i % len(CATEGORIES) + 1),
+                 name='GET /categories/<id>/questions'),
+        Endpoint('POST', '/questions/search', json={'searchTerm': 'capital'}, read_only=True),
+        Endpoint('POST', '/questions', json=lambda i: {'question': 'Benchmark question {}?'.format(i),
+                                                       'answer': 'Yes', 'category': 1, 'difficulty': 1}),
+        Endpoint('DELETE', lambda i: '/questions/{}'.format(new_question(i)), name='DELETE /questions/<id>'),
+        Endpoint('POST', '/quizzes', read_only=True,
+                 json=lambda i: {'quiz_category': {'id': i % (len(CATEGORIES) + 1)},
+                                 'previous_questions': [question(i + j) for j in range(10)]}),
+        Endpoint('POST', '/quizzes/sessions', json={'quiz_category': {'id': 0}}, read_only=True),
+        Endpoint('POST', '/quizzes/sessions/{}/next'.format(session_id), read_only=True,
+                 name='POST /quizzes/sessions/<id>/next'),
+        Endpoint('GET', '/metrics'),
+    ]
+
+
+def quiz_benchmark(app, size, iterations):
+    """POST /quizzes with longer and longer previous_questions lists: its
+    latency and statements should stay flat."""
+    results = {}
+    for previous in (0, 10, 100, 1000):
+        body = {'quiz_category': {'id': 0}, 'previous_questions': list(range(1, min(previous, size) + 1))}
+        endpoint = Endpoint('POST', '/quizzes', json=body)
+        results[str(previous)] = drive_client(app, [endpoint], iterations, 1)['POST /quizzes']
+    return results
+
+
+def allocated(function):
+    """Peak bytes allocated while function runs."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def projection_benchmark(app, rows, repeat):
+    """One page of formatted questions from Question objects against the
+    (id, question, answer, category, difficulty) rows paginate_questions
+    reads."""
+    with app.app_context():
+        query = Question.query.order_by(Question.id).limit(rows)
+        orm = lambda: [q.format() for q in query]
+        projection = lambda: [Question.format_row(r) for r in query.with_entities(*Question.format_columns())]
+        results = {}
+        for name, function in (('orm', orm), ('projection', projection)):
+            results[name] = timeit(function, repeat)
+            results[name]['peak_kb'] = round(allocated(function) / 1024, 1)
+            db.session.remove()
+    results['rows'] = rows
+    return results
+
+
+def questions(app, count):
+    with app.app_context():
+        page = [Question.format_row(r) for r in
+                Question.query.order_by(Question.id).with_entities(*Question.format_columns()).limit(count)]
+        db.session.remove()
+    return [dict(page[i % len(page)], id=i + 1) for i in range(count)]
+
+
+def encoding_benchmark(app, count, repeat):
+    """jsonify()'s encoder (FastJSONEncoder, through orjson when it is
+    installed) against the json module, on count formatted questions."""
+    payload = {'success': True, 'questions': questions(app, count), 'totalQuestions': count}
+    with app.app_context():
+        results = {'app_encoder': timeit(lambda: flask_json.dumps(payload), repeat),
+                   'json_module': timeit(lambda: json.dumps(payload), repeat),
+                   'bytes': len(flask_json.dumps(payload).encode()),
+                   'orjson': orjson is not None,
+                   'questions': count}
+    return results
+
+
+def compression_benchmark(app, repeat):
+    """Bytes on the wire and compression time of question lists of
+    increasing length, with each of the algorithms compress() supports."""
+    results = {}
+    algorithms = ('gzip', 'br') if brotli is not None else ('gzip',)
+    for count in (10, 100, 1000, 10000):
+        data = json.dumps({'success': True, 'questions': questions(app, count)}).encode()
+        result = {'bytes': len(data)}
+        for encoding in algorithms:
+            result[encoding] = timeit(lambda: compress(data, encoding, app.config), repeat)
+            result[encoding]['bytes'] = len(compress(data, encoding, app.config))
+        results[str(count)] = result
+    return results
+
+
+def micro(app, size):
+    return {'quiz_previous_questions': quiz_benchmark(app, size, 10),
+            'projection_vs_orm': projection_benchmark(app, min(size, 1000), 10),
+            'json_encoding': encoding_benchmark(app, 10000, 10),
+            'compression': compression_benchmark(app, 10)}
+
+
+if __name__ == '__main__':
+    main('trivia', setup, endpoints, micro)
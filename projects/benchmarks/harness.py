@@ -0,0 +1,284 @@
+"""Shared pieces of the endpoint benchmarks: the endpoint definitions, the
+test client and HTTP load drivers, query counting, and the JSON results
+that run.py merges into a baseline and diffs."""
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from urllib.parse import urlencode
+
+from sqlalchemy import MetaData, create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+
+PROJECTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED = 20201018
+
+
+def use_app_dir(*parts):
+    """Puts an app's directory first on sys.path, so its modules import
+    the way they do when the app is run from there."""
+    path = os.path.join(PROJECTS_DIR, *parts)
+    sys.path.insert(0, path)
+    return path
+
+
+class Endpoint:
+    """One request to benchmark, with a json body, form data or a raw
+    body (give its Content-Type in headers). path and the body may also be
+    functions of the iteration number, for requests that must differ every
+    time (creating or deleting a different row). Only read_only endpoints
+    are sent by the HTTP load generator, which runs them concurrently."""
+
+    def __init__(self, method, path, json=None, data=None, body=None, headers=None,
+                 status=200, read_only=None, name=None):
+        self.method = method
+        self.path = path
+        self.json = json
+        self.data = data
+        self.body = body
+        self.headers = dict(headers or {})
+        self.status = status
+        self.read_only = method == 'GET' if read_only is None else read_only
+        self.name = name or '{} {}'.format(method, path if isinstance(path, str) else path.__name__)
+
+    def build(self, i):
+        """Returns the (path, body, headers) of the i-th request."""
+        value = lambda v: v(i) if callable(v) else v
+        headers = dict(self.headers)
+        body = None
+        if self.json is not None:
+            body = json.dumps(value(self.json)).encode()
+            headers['Content-Type'] = 'application/json'
+        elif self.data is not None:
+            body = urlencode(value(self.data), doseq=True).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif self.body is not None:
+            body = value(self.body)
+            body = body.encode() if isinstance(body, str) else body
+        return value(self.path), body, headers
+
+
+def percentiles(samples):
+    """p50/p95/p99 (nearest rank) and mean of samples in seconds, in ms."""
+    ordered = sorted(samples)
+    rank = lambda p: ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+    return {'p50_ms': round(rank(50) * 1000, 3),
+            'p95_ms': round(rank(95) * 1000, 3),
+            'p99_ms': round(rank(99) * 1000, 3),
+            'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+            'samples': len(ordered)}
+
+
+def timeit(function, repeat):
+    """Calls function repeat times, returns the percentiles of its time."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+class QueryCounter:
+    """Counts the SQL statements of every engine in the process. The test
+    client driver sends one request at a time, so the count between two
+    reads is that request's, including the statements a streamed body
+    runs after the view returned."""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def after_cursor_execute(self, *args):
+        self.count += 1
+
+
+def quiet(app):
+    """Turns off debug mode, the per request log lines and deprecation
+    warnings, which would otherwise be part of what is measured."""
+    warnings.simplefilter('ignore', DeprecationWarning)
+    app.debug = False
+    app.logger.setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+
+def reset_database(url):
+    """Starts the benchmark from an empty database: a SQLite file is
+    removed, any other database has all its tables dropped."""
+    url = make_url(url)
+    if url.drivername.startswith('sqlite'):
+        if url.database and os.path.exists(url.database):
+            os.remove(url.database)
+        return
+    engine = create_engine(url)
+    metadata = MetaData()
+    metadata.reflect(engine)
+    metadata.drop_all(engine)
+    engine.dispose()
+
+
+def drive_client(app, endpoints, iterations, warmup):
+    """Sends every endpoint warmup + iterations times through the test
+    client, one after the other. Returns latency percentiles, the median
+    statement count and the response size of each."""
+    counter = QueryCounter()
+    client = app.test_client(use_cookies=False)
+    results = {}
+    for endpoint in endpoints:
+        samples, queries, size = [], [], 0
+        for i in range(warmup + iterations):
+            path, body, headers = endpoint.build(i)
+            before = counter.count
+            started = time.perf_counter()
+            response = client.open(path, method=endpoint.method, data=body, headers=headers)
+            data = response.get_data()
+            response.close()
+            elapsed = time.perf_counter() - started
+            if response.status_code != endpoint.status:
+                raise AssertionError('{} returned {} instead of {}'.format(
+                    endpoint.name, response.status_code, endpoint.status))
+            if i >= warmup:
+                samples.append(elapsed)
+                queries.append(counter.count - before)
+                size = len(data)
+        result = percentiles(samples)
+        result['queries'] = int(statistics.median(queries))
+        result['bytes'] = size
+        results[endpoint.name] = result
+    event.remove(Engine, 'after_cursor_execute', counter.after_cursor_execute)
+    return results
+
+
+def drive_http(app, endpoints, threads, requests):
+    """Serves app with werkzeug's threaded server and sends requests
+    requests per thread from threads threads, each picking the read_only
+    endpoints at random. Returns latency percentiles and throughput per
+    endpoint and overall; responses with another status count as errors."""
+    from werkzeug.serving import make_server
+
+    endpoints = [e for e in endpoints if e.read_only]
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    port = server.server_port
+
+    samples = {e.name: [] for e in endpoints}
+    errors = {e.name: 0 for e in endpoints}
+    lock = threading.Lock()
+
+    def work(number):
+        rng = random.Random(SEED + number)
+        for i in range(requests):
+            endpoint = rng.choice(endpoints)
+            path, body, headers = endpoint.build(number * requests + i)
+            headers.setdefault('Accept-Encoding', 'gzip, deflate, br')
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            started = time.perf_counter()
+            try:
+                connection.request(endpoint.method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == endpoint.status
+            except (OSError, http.client.HTTPException):
+                ok = False
+            finally:
+                connection.close()
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    samples[endpoint.name].append(elapsed)
+                else:
+                    errors[endpoint.name] += 1
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    server.server_close()
+
+    results = {}
+    for name, times in samples.items():
+        if not times and not errors[name]:
+            continue
+        result = percentiles(times) if times else {'samples': 0}
+        result['errors'] = errors[name]
+        result['rps'] = round(len(times) / elapsed, 1)
+        results[name] = result
+    everything = [t for times in samples.values() for t in times]
+    total = percentiles(everything) if everything else {'samples': 0}
+    total['errors'] = sum(errors.values())
+    total['rps'] = round(len(everything) / elapsed, 1)
+    total['threads'] = threads
+    results['all'] = total
+    return results
+
+
+def main(name, setup, endpoints, micro=None):
+    """Command line of one app's benchmark (bench_<app>.py --help):
+    setup(database_url, size) returns the app with its database seeded,
+    endpoints(app, size) the Endpoints to drive and micro(app, size) the
+    results of the benchmarks that time something other than a request."""
+    parser = argparse.ArgumentParser(description='Benchmark the {} endpoints.'.format(name))
+    parser.add_argument('--size', type=int, default=1000,
+                        help='rows in the largest table of the synthetic dataset')
+    parser.add_argument('--database-url',
+                        help='SQLAlchemy URL of a database the benchmark may wipe '
+                             '(default: a temporary SQLite file)')
+    parser.add_argument('--iterations', type=int, default=30, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per endpoint first')
+    parser.add_argument('--threads', type=int, default=8, help='HTTP load generator threads')
+    parser.add_argument('--requests', type=int, default=50, help='HTTP requests per thread (0 to skip)')
+    parser.add_argument('--skip-micro', action='store_true', help='only benchmark the endpoints')
+    parser.add_argument('--output', help='write the results here instead of to stdout')
+    args = parser.parse_args()
+
+    directory = None
+    url = args.database_url
+    if url is None:
+        directory = tempfile.mkdtemp(prefix='bench_{}_'.format(name))
+        url = 'sqlite:///' + os.path.join(directory, name + '.db')
+    try:
+        reset_database(url)
+        started = time.perf_counter()
+        app = setup(url, args.size)
+        seeded = time.perf_counter() - started
+        quiet(app)
+
+        results = {
+            'meta': {'size': args.size,
+                     'database': make_url(url).get_backend_name(),
+                     'seed_seconds': round(seeded, 2),
+                     'iterations': args.iterations,
+                     'python': platform.python_version()},
+            'client': drive_client(app, endpoints(app, args.size), args.iterations, args.warmup),
+        }
+        if args.requests:
+            results['http'] = drive_http(app, endpoints(app, args.size), args.threads, args.requests)
+        if micro is not None and not args.skip_micro:
+            results['micro'] = micro(app, args.size)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
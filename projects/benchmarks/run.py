@@ -0,0 +1,132 @@
+"""Runs the Fyyur, Trivia and coffee shop benchmarks, merges their results
+into one JSON document and diffs it against a baseline:
+
+    python run.py --size 10000 --output baseline.json
+    python run.py --size 10000 --output current.json --compare baseline.json
+
+Each app runs in a process of its own (Fyyur and Trivia both have a
+top-level models module). --compare exits with status 1 when a latency
+got slower than the baseline by more than --tolerance, or an endpoint runs
+more statements than it did."""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+APPS = ('fyyur', 'trivia', 'coffee')
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LATENCIES = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def app_option(values, app, default=None):
+    """The value of an option given as VALUE (for every app) or APP=VALUE."""
+    result = default
+    for value in values or ():
+        name, sep, rest = value.partition('=')
+        if not sep:
+            result = value
+        elif name == app:
+            result = rest
+    return result
+
+
+def run_app(app, args):
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        output = f.name
+    command = [sys.executable, os.path.join(BENCH_DIR, 'bench_{}.py'.format(app)),
+               '--size', app_option(args.size, app, '1000'),
+               '--iterations', str(args.iterations),
+               '--warmup', str(args.warmup),
+               '--threads', str(args.threads),
+               '--requests', str(args.requests),
+               '--output', output]
+    url = app_option(args.database_url, app)
+    if url:
+        command += ['--database-url', url]
+    if args.skip_micro:
+        command.append('--skip-micro')
+    try:
+        subprocess.run(command, check=True)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        os.remove(output)
+
+
+def flatten(results, prefix=()):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, prefix + (key,))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + (key,), value
+
+
+def compare(baseline, current, tolerance, min_ms):
+    """Returns a line for each regression of current against baseline:
+    a latency over baseline * (1 + tolerance) and at least min_ms slower,
+    or a statement count above the baseline's. Numbers missing from
+    either side are not compared."""
+    before = dict(flatten(baseline))
+    regressions = []
+    for key, value in flatten(current):
+        old = before.get(key)
+        if old is None:
+            continue
+        name = ' / '.join(key)
+        if key[-1] in LATENCIES and value > old * (1 + tolerance) and value - old >= min_ms:
+            regressions.append('{}: {:.3f} ms, was {:.3f} ms ({:+.0%})'.format(
+                name, value, old, value / old - 1 if old else float('inf')))
+        elif key[-1] == 'queries' and value > old:
+            regressions.append('{}: {} queries, was {}'.format(name, value, old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--apps', nargs='+', choices=APPS, default=APPS)
+    parser.add_argument('--size', action='append',
+                        help='rows of the synthetic datasets (default 1000), '
+                             'or APP=ROWS for one app; may be repeated')
+    parser.add_argument('--database-url', action='append',
+                        help='APP=URL of a database the benchmark may wipe, '
+                             'default a temporary SQLite file; may be repeated')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--output', help='write the results here instead of to stdout')
+    parser.add_argument('--results', help='diff these results instead of running the benchmarks')
+    parser.add_argument('--compare', metavar='BASELINE', help='results to diff against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='slowdown allowed before a latency counts as a regression')
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help='latency differences smaller than this are never regressions')
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        results = {app: run_app(app, args) for app in args.apps}
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output + '\n')
+        elif not args.compare:
+            print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance, args.min_ms)
+        for line in regressions:
+            print(line)
+        print('{} regression(s) against {}'.format(len(regressions), args.compare))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+'''
+fsnd_common
+    the parts of Fyyur, the Trivia API and the coffee shop backend that are
+    the same in all of them: database engines and read replicas (engine,
+    replicas), conditional GETs (caching), response compression and JSON
+    encoding (compression, encoding), and request profiling and Prometheus
+    metrics (profiling, metrics).
+'''
@@ -0,0 +1,206 @@
+import calendar
+import re
+import time
+from functools import wraps
+from email.utils import formatdate
+from flask import g, has_app_context, request, make_response, session
+from sqlalchemy import Column, Float, BigInteger, MetaData, String, Table, event, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+TABLE_NAME = 'collection_versions'
+# the current time in seconds since the epoch, as each database's
+# triggers compute it
+NOW = {
+    'sqlite': "(julianday('now') - 2440587.5) * 86400.0",
+    'postgresql': 'extract(epoch from clock_timestamp())',
+}
+POSTGRESQL_FUNCTION = f'''
+CREATE OR REPLACE FUNCTION bump_{TABLE_NAME}() RETURNS trigger AS $$
+BEGIN
+    UPDATE {TABLE_NAME} SET version = version + 1, modified = {NOW['postgresql']}
+    WHERE name = ANY(TG_ARGV);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql'''
+COLLECTION_NAME = re.compile(r'^\w+$')
+
+def versions_table(metadata):
+    table = metadata.tables.get(TABLE_NAME)
+    if table is None:
+        table = Table(TABLE_NAME, metadata,
+                      Column('name', String(64), primary_key=True),
+                      Column('version', BigInteger, nullable=False),
+                      Column('modified', Float, nullable=False))
+    return table
+
+def trigger_statements(dialect, table, collections):
+    trigger = f'{TABLE_NAME}_{table}'
+    if dialect == 'postgresql':
+        arguments = ', '.join(f"'{collection}'" for collection in collections)
+        yield f'DROP TRIGGER IF EXISTS "{trigger}" ON "{table}"'
+        yield (f'CREATE TRIGGER "{trigger}" AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{table}" '
+               f'FOR EACH STATEMENT EXECUTE PROCEDURE bump_{TABLE_NAME}({arguments})')
+    else:
+        names = ', '.join(f"'{collection}'" for collection in collections)
+        for operation in ('insert', 'update', 'delete'):
+            yield f'DROP TRIGGER IF EXISTS "{trigger}_{operation}"'
+            yield (f'CREATE TRIGGER "{trigger}_{operation}" AFTER {operation.upper()} ON "{table}" BEGIN '
+                   f'UPDATE {TABLE_NAME} SET version = version + 1, modified = {NOW[dialect]} '
+                   f'WHERE name IN ({names}); END')
+
+def install_after_create(metadata, connection, tables=(), **kw):
+    versions = metadata.info.get(TABLE_NAME)
+    if versions is not None and versions.table in tables:
+        versions.install(connection)
+
+def forget_versions(session):
+    if has_app_context():
+        g.pop('collection_versions', None)
+
+'''
+CollectionVersions
+    version counters for the resource collections served by public GET
+    endpoints, used as their ETag and Last-Modified. They are rows of the
+    collection_versions table. A trigger on each tracked table bumps them
+    in the same transaction as any write to it, whether it comes from this
+    process, another worker or psql. So every worker hands out the same
+    ETag for the same data.
+
+    track(collection, *models) names the models (or tables) a collection
+    is built from. install() creates the table, its rows and the triggers
+    on SQLite and PostgreSQL; it is safe to run again, but it replaces the
+    triggers, so it belongs in a setup step rather than app startup.
+    listen() runs it after a db.create_all() that creates the versions
+    table, and forgets the versions read in an app context when its session
+    commits. Apps whose schema is managed by migrations run install() from
+    a migration instead. Each statement that writes a tracked PostgreSQL
+    table takes a lock on the collection's row until it commits, which
+    serializes concurrent writers to the same collection.
+
+    read() takes the versions from the database once per app context,
+    through the request's session (so on a replica, the versions match the
+    rows they are served with), and again after a commit.
+'''
+class CollectionVersions:
+    def __init__(self, db=None):
+        self.db = db
+        self.table = versions_table(db.metadata if db is not None else MetaData())
+        self.tables = {}
+        self.collections = set()
+
+    def track(self, collection, *models):
+        if not COLLECTION_NAME.match(collection):
+            raise ValueError(f'collection names are letters, digits and _, not {collection!r}')
+        self.collections.add(collection)
+        for model in models:
+            table = getattr(model, '__table__', model)
+            self.tables.setdefault(getattr(table, 'name', table), set()).add(collection)
+
+    def install(self, bind):
+        dialect = bind.dialect.name
+        if dialect not in NOW:
+            raise ValueError(f'collection versions have triggers for {" and ".join(NOW)}, not {dialect}')
+        if isinstance(bind, Engine):
+            with bind.begin() as connection:
+                return self.install(connection)
+        if dialect == 'postgresql':
+            # one worker at a time replaces the triggers
+            bind.execute(text(f"SELECT pg_advisory_lock(hashtext('{TABLE_NAME}'))"))
+        try:
+            self.table.create(bind, checkfirst=True)
+            for collection in sorted(self.collections):
+                bind.execute(text(f'INSERT INTO {TABLE_NAME} (name, version, modified) '
+                                  'VALUES (:name, 0, :modified) ON CONFLICT (name) DO NOTHING'),
+                             name=collection, modified=time.time())
+            if dialect == 'postgresql':
+                bind.execute(text(POSTGRESQL_FUNCTION))
+            for table, collections in sorted(self.tables.items()):
+                for statement in trigger_statements(dialect, table, sorted(collections)):
+                    bind.execute(text(statement))
+        finally:
+            if dialect == 'postgresql':
+                bind.execute(text(f"SELECT pg_advisory_unlock(hashtext('{TABLE_NAME}'))"))
+
+    def uninstall(self, bind):
+        for table in sorted(self.tables):
+            for statement in trigger_statements(bind.dialect.name, table, ()):
+                if statement.startswith('DROP'):
+                    bind.execute(text(statement))
+        if bind.dialect.name == 'postgresql':
+            bind.execute(text(f'DROP FUNCTION IF EXISTS bump_{TABLE_NAME}()'))
+        self.table.drop(bind, checkfirst=True)
+
+    def listen(self):
+        metadata = self.db.metadata
+        metadata.info[TABLE_NAME] = self
+        if not event.contains(metadata, 'after_create', install_after_create):
+            event.listen(metadata, 'after_create', install_after_create)
+        if not event.contains(Session, 'after_commit', forget_versions):
+            event.listen(Session, 'after_commit', forget_versions)
+
+    def read(self, *collections):
+        known = g.setdefault('collection_versions', {}) if has_app_context() else {}
+        missing = [collection for collection in collections if collection not in known]
+        if missing:
+            table = self.table
+            rows = self.db.session.execute(select([table.c.name, table.c.version, table.c.modified])
+                                           .where(table.c.name.in_(missing)))
+            known.update((name, (version, modified)) for name, version, modified in rows)
+        return {collection: known.get(collection) for collection in collections}
+
+    def etag(self, *collections):
+        versions = self.read(*collections)
+        if None in versions.values():
+            return None
+        return '-'.join(f'{collection}.{version}.{int(modified * 1000):x}'
+                        for collection, (version, modified) in versions.items())
+
+    def last_modified(self, *collections):
+        versions = self.read(*collections)
+        if None in versions.values():
+            return None
+        return max(modified for version, modified in versions.values())
+
+'''
+conditional(versions, *collections, max_age=0)
+    decorator for public GET views built only from the given collections.
+    A request whose If-None-Match (or If-Modified-Since) is still current
+    gets a 304 without running the view; other responses carry the ETag,
+    Last-Modified and a public Cache-Control so a CDN in front can serve
+    and revalidate them. Pages with pending flash messages are personal
+    and are neither revalidated nor marked cacheable.
+'''
+def conditional(versions, *collections, max_age=0):
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            etag = versions.etag(*collections)
+            if etag is None:
+                # the collection versions are not installed
+                return f(*args, **kwargs)
+            last_modified = int(versions.last_modified(*collections))
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = since is not None and last_modified <= calendar.timegm(since.utctimetuple())
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+            response.headers['Cache-Control'] = f'public, max-age={max_age}, must-revalidate'
+            return response
+
+        return wrapper
+    return conditional_decorator
@@ -0,0 +1,98 @@
+import gzip
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULTS = {
+    # responses smaller than this many bytes are sent as they are
+    'COMPRESS_MIN_SIZE': 500,
+    'COMPRESS_MIMETYPES': ('text/html', 'text/css', 'text/plain', 'text/xml',
+                           'application/json', 'application/javascript'),
+    # in order of preference, when the client accepts several equally
+    'COMPRESS_ALGORITHMS': ('br', 'gzip'),
+    'COMPRESS_LEVEL': 6,
+    'COMPRESS_BROTLI_QUALITY': 4,
+}
+
+'''
+compress(data, encoding, config) and compressor(encoding, config)
+    one-shot compression of a whole body, and a (compress, finish) pair of
+    functions for compressing a streamed body chunk by chunk. compress
+    flushes after every chunk, so each one reaches the client as soon as it
+    is produced.
+'''
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, config['COMPRESS_LEVEL'])
+
+def compressor(encoding, config):
+    if encoding == 'br':
+        stream = brotli.Compressor(quality=config['COMPRESS_BROTLI_QUALITY'])
+        return (lambda chunk: stream.process(chunk) + stream.flush()), stream.finish
+    # wbits 16 + 15 writes a gzip header and trailer around the deflate stream
+    stream = zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return (lambda chunk: stream.compress(chunk) + stream.flush(zlib.Z_SYNC_FLUSH)), stream.flush
+
+def compress_stream(chunks, encoding, config, charset='utf-8'):
+    compress_chunk, finish = compressor(encoding, config)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = compress_chunk(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+'''
+init_compression(app)
+    compresses the app's responses with brotli (when the brotli package is
+    installed) or gzip, whichever the request's Accept-Encoding prefers.
+    Only the COMPRESS_MIMETYPES are compressed, and only from
+    COMPRESS_MIN_SIZE bytes up, as smaller bodies gain less than the
+    compression costs; streamed responses are compressed as they stream,
+    whatever their size. Each setting can be overridden in app.config.
+'''
+def init_compression(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    @app.after_request
+    def compress_response(response):
+        config = app.config
+        if response.mimetype not in config['COMPRESS_MIMETYPES']:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough or 'Content-Encoding' in response.headers):
+            return response
+        algorithms = [a for a in config['COMPRESS_ALGORITHMS'] if a != 'br' or brotli is not None]
+        encoding = request.accept_encodings.best_match(algorithms)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, config, response.charset)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(compress(data, encoding, config))
+
+        response.headers['Content-Encoding'] = encoding
+        # the compressed body is no longer byte for byte the one a strong
+        # ETag was computed for
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
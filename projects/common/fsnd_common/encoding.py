@@ -0,0 +1,38 @@
+import datetime
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+FastJSONEncoder
+    json_encoder for the app, so jsonify() and flask.json.dumps() encode
+    through orjson when it is installed (several times faster than the json
+    module on long lists) and through the json module otherwise.
+
+    Dates and datetimes come out as ISO 8601 strings with either backend.
+    Whatever orjson refuses (integers past 64 bits, an indent other than 2)
+    goes through the json module instead; orjson writes non-ASCII text as
+    UTF-8 rather than \\u escapes.
+'''
+class FastJSONEncoder(JSONEncoder):
+    def default(self, o):
+        if isinstance(o, (datetime.date, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+    def encode(self, o):
+        if orjson is None or self.indent not in (None, 2):
+            return super().encode(o)
+
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(o, default=self.default, option=option).decode()
+        except TypeError:
+            return super().encode(o)
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+'''
+SETTINGS
+    the environment variables engine_options() reads: name, type and the
+    default used when the variable is not set.
+'''
+SETTINGS = {
+    'DATABASE_POOL_SIZE': (int, 5),
+    'DATABASE_MAX_OVERFLOW': (int, 10),
+    # seconds a request waits for a connection before giving up
+    'DATABASE_POOL_TIMEOUT': (float, 30),
+    # seconds after which a connection is replaced, -1 for never
+    'DATABASE_POOL_RECYCLE': (int, -1),
+    'DATABASE_POOL_PRE_PING': (bool, True),
+    'DATABASE_STATEMENT_TIMEOUT_MS': (int, None),
+    # PgBouncer in transaction pooling mode pools the connections itself
+    'DATABASE_PGBOUNCER': (bool, False),
+}
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y', 'on')
+# postgres:// is the older spelling of the scheme
+POSTGRESQL = ('postgresql', 'postgres')
+
+def setting(name, environ=os.environ):
+    type, default = SETTINGS[name]
+    value = environ.get(name, '').strip()
+    if not value:
+        return default
+    if type is bool:
+        return value.lower() in TRUE_VALUES
+    try:
+        return type(value)
+    except ValueError:
+        raise ValueError('{} must be a number, not {!r}'.format(name, value))
+
+'''
+CheckoutStats
+    how many connections a pool handed out, the total and the longest time
+    callers spent getting one (waiting for a free connection, opening a new
+    one and pre-pinging it), and how many gave up after the pool timeout.
+    A pool whose waits grow with the number of workers is too small for
+    them, or the database's max_connections is.
+'''
+class CheckoutStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.seconds = 0.0
+        self.longest = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.seconds += seconds
+            self.longest = max(self.longest, seconds)
+
+    def timed_out(self):
+        with self.lock:
+            self.timeouts += 1
+
+    def stats(self):
+        with self.lock:
+            return {'checkouts': self.count,
+                    'seconds': self.seconds,
+                    'longest': self.longest,
+                    'timeouts': self.timeouts}
+
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = CheckoutStats()
+
+    def timed(self, checkout):
+        started = time.perf_counter()
+        try:
+            connection = checkout()
+        except exc.TimeoutError:
+            self.checkouts.timed_out()
+            raise
+        self.checkouts.record(time.perf_counter() - started)
+        return connection
+
+    # sessions check out through connect(), engine.connect() through
+    # unique_connection()
+    def connect(self):
+        return self.timed(super().connect)
+
+    def unique_connection(self):
+        return self.timed(super().unique_connection)
+
+def set_local_statement_timeout(conn):
+    timeout = conn.get_execution_options().get('local_statement_timeout_ms')
+    if timeout:
+        conn.execute(text('SET LOCAL statement_timeout = {:d}'.format(timeout)))
+
+'''
+engine_options(url, environ)
+    create_engine() options for url from the DATABASE_* settings in
+    environ. SQLite keeps the pools Flask-SQLAlchemy picks for it. Other
+    databases get a TimedQueuePool, or with DATABASE_PGBOUNCER no pool of
+    their own, as PgBouncer already is one; PgBouncer also rejects the
+    startup options that set the statement timeout of a PostgreSQL
+    connection, so there every transaction sets it with SET LOCAL instead.
+'''
+def engine_options(url, environ=os.environ):
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    pgbouncer = setting('DATABASE_PGBOUNCER', environ)
+    statement_timeout = setting('DATABASE_STATEMENT_TIMEOUT_MS', environ)
+    if pgbouncer:
+        options = {'poolclass': NullPool}
+    else:
+        options = {'poolclass': TimedQueuePool,
+                   'pool_size': setting('DATABASE_POOL_SIZE', environ),
+                   'max_overflow': setting('DATABASE_MAX_OVERFLOW', environ),
+                   'pool_timeout': setting('DATABASE_POOL_TIMEOUT', environ),
+                   'pool_recycle': setting('DATABASE_POOL_RECYCLE', environ),
+                   'pool_pre_ping': setting('DATABASE_POOL_PRE_PING', environ)}
+
+    if statement_timeout and url.get_backend_name() in POSTGRESQL:
+        if pgbouncer:
+            options['execution_options'] = {'local_statement_timeout_ms': statement_timeout}
+            if not event.contains(Engine, 'begin', set_local_statement_timeout):
+                event.listen(Engine, 'begin', set_local_statement_timeout)
+        else:
+            options['connect_args'] = {'options': '-c statement_timeout={:d}'.format(statement_timeout)}
+    return options
+
+'''
+PooledSQLAlchemy
+    Flask-SQLAlchemy whose engines are created with engine_options() for
+    their URL, whenever that is set. SQLALCHEMY_ENGINE_OPTIONS in the app
+    config still overrides them.
+'''
+class PooledSQLAlchemy(SQLAlchemy):
+    def apply_driver_hacks(self, app, sa_url, options):
+        rv = super().apply_driver_hacks(app, sa_url, options)
+        options.update(engine_options(sa_url))
+        return rv
@@ -0,0 +1,301 @@
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
+from flask import Response, g, request
+
+# request latency buckets in seconds, as in the Prometheus client libraries
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+HEADER = struct.Struct('i4x')
+KEY_LENGTH = struct.Struct('i')
+VALUE = struct.Struct('d')
+
+def sample_key(name, labels):
+    if not labels:
+        return name
+    pairs = ['{}="{}"'.format(label, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+             for label, value in labels]
+    return name + '{' + ','.join(pairs) + '}'
+
+def bucket_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+def read_entries(data, used):
+    '''
+    Yields the (key, value, value offset) entries of a metrics file: after
+    the header, each entry is the length of its key, the key padded to 8
+    bytes and a float64.
+    '''
+    position = HEADER.size
+    while position < used:
+        length, = KEY_LENGTH.unpack_from(data, position)
+        position += KEY_LENGTH.size
+        key = bytes(data[position:position + length]).decode()
+        position += length + (-(position + length) % 8)
+        value, = VALUE.unpack_from(data, position)
+        yield key, value, position
+        position += VALUE.size
+
+'''
+DictValues and MmapValues
+    a process's float values by sample key. DictValues keeps them in
+    memory; MmapValues in a file of its own, mapped with mmap so that
+    whichever worker serves /metrics can read the values of all of them.
+    A new key is written in full before the used size in the header grows
+    over it, so a reader never sees half an entry.
+'''
+class DictValues:
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def add(self, amounts):
+        with self.lock:
+            for key, amount in amounts:
+                self.values[key] = self.values.get(key, 0.0) + amount
+
+    def items(self):
+        with self.lock:
+            return list(self.values.items())
+
+class MmapValues:
+    INITIAL_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.INITIAL_SIZE:
+            self.file.truncate(self.INITIAL_SIZE)
+            size = self.INITIAL_SIZE
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.used = HEADER.unpack_from(self.map, 0)[0] or HEADER.size
+        self.positions = {key: position for key, value, position in read_entries(self.map, self.used)}
+
+    def position(self, key):
+        position = self.positions.get(key)
+        if position is not None:
+            return position
+
+        encoded = key.encode()
+        start = self.used
+        position = start + KEY_LENGTH.size + len(encoded)
+        position += -position % 8
+        end = position + VALUE.size
+        if end > len(self.map):
+            size = len(self.map)
+            while size < end:
+                size *= 2
+            self.map.close()
+            self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), size)
+
+        KEY_LENGTH.pack_into(self.map, start, len(encoded))
+        self.map[start + KEY_LENGTH.size:start + KEY_LENGTH.size + len(encoded)] = encoded
+        VALUE.pack_into(self.map, position, 0.0)
+        self.used = end
+        HEADER.pack_into(self.map, 0, end)
+        self.positions[key] = position
+        return position
+
+    def add(self, amounts):
+        with self.lock:
+            for key, amount in amounts:
+                position = self.position(key)
+                value, = VALUE.unpack_from(self.map, position)
+                VALUE.pack_into(self.map, position, value + amount)
+
+    def items(self):
+        with self.lock:
+            return [(key, value) for key, value, position in read_entries(self.map, self.used)]
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return []
+    used = min(HEADER.unpack_from(data, 0)[0], len(data))
+    return [(key, value) for key, value, position in read_entries(data, used)]
+
+'''
+Metrics
+    counters and histograms in Prometheus' text format. Values go to a
+    DictValues, or to one MmapValues file per process in directory, so
+    that every gunicorn worker counts in a file of its own and render()
+    sums the files of all of them. Clear directory before the server starts,
+    as the Prometheus client does with its multiprocess directory; the files
+    of workers that have exited keep counting towards the totals.
+
+    collectors are functions called on render() that yield
+    (name, type, labels, value) samples read at that moment, e.g. pool
+    gauges; they describe only the process serving /metrics and are
+    labelled with its pid.
+'''
+class Metrics:
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.types = {}
+        self.collectors = []
+        self.keys = {}
+        self.lock = threading.Lock()
+        self.pid = None
+        self.values = None
+
+    def declare(self, name, type):
+        self.types[name] = type
+
+    def store(self):
+        # a worker forked after the first use opens a file of its own
+        pid = os.getpid()
+        if self.pid != pid:
+            with self.lock:
+                if self.pid != pid:
+                    if self.directory:
+                        os.makedirs(self.directory, exist_ok=True)
+                        self.values = MmapValues(os.path.join(self.directory, 'metrics_{}.db'.format(pid)))
+                    else:
+                        self.values = DictValues()
+                    self.pid = pid
+        return self.values
+
+    def inc(self, name, labels=(), amount=1.0):
+        self.store().add([(sample_key(name, labels), amount)])
+
+    def histogram_keys(self, name, labels):
+        keys = self.keys.get((name, labels))
+        if keys is None:
+            buckets = [(bound, sample_key(name + '_bucket', labels + (('le', bucket_bound(bound)),)))
+                       for bound in BUCKETS]
+            keys = self.keys[(name, labels)] = (buckets,
+                                                sample_key(name + '_sum', labels),
+                                                sample_key(name + '_count', labels))
+        return keys
+
+    def observe(self, name, labels, value):
+        buckets, sum_key, count_key = self.histogram_keys(name, labels)
+        amounts = [(key, 1.0 if value <= bound else 0.0) for bound, key in buckets]
+        amounts += [(sum_key, value), (count_key, 1.0)]
+        self.store().add(amounts)
+
+    def samples(self):
+        if not self.directory:
+            return self.store().items()
+        self.store()
+        totals = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, 'metrics_*.db'))):
+            for key, value in read_file(path):
+                totals[key] = totals.get(key, 0.0) + value
+        return list(totals.items())
+
+    def metric_name(self, key):
+        name = key.split('{', 1)[0]
+        for suffix in ('_bucket', '_sum', '_count'):
+            base = name[:-len(suffix)]
+            if name.endswith(suffix) and self.types.get(base) == 'histogram':
+                return base
+        return name
+
+    def render(self):
+        families = {}
+        for key, value in self.samples():
+            families.setdefault(self.metric_name(key), []).append((key, value))
+        pid = (('pid', os.getpid()),)
+        for collect in self.collectors:
+            for name, type, labels, value in collect():
+                self.types.setdefault(name, type)
+                families.setdefault(name, []).append((sample_key(name, tuple(labels) + pid), value))
+
+        lines = []
+        for name, samples in families.items():
+            lines.append('# TYPE {} {}'.format(name, self.types.get(name, 'untyped')))
+            lines.extend('{} {}'.format(key, repr(float(value))) for key, value in samples)
+        return '\n'.join(lines) + '\n'
+
+def pool_collector(db):
+    '''
+    Gauges of the connection pool of db's engine, as far as its pool class
+    keeps them, and the checkout counts and times of a TimedQueuePool.
+    '''
+    def collect():
+        pool = db.engine.pool
+        for name, method in (('db_pool_size', 'size'), ('db_pool_checked_in', 'checkedin'),
+                             ('db_pool_checked_out', 'checkedout'), ('db_pool_overflow', 'overflow')):
+            if callable(getattr(pool, method, None)):
+                yield name, 'gauge', (), getattr(pool, method)()
+        checkouts = getattr(pool, 'checkouts', None)
+        if checkouts is not None:
+            s = checkouts.stats()
+            yield 'db_pool_checkouts_total', 'counter', (), s['checkouts']
+            yield 'db_pool_checkout_seconds_total', 'counter', (), s['seconds']
+            yield 'db_pool_checkout_seconds_max', 'gauge', (), s['longest']
+            yield 'db_pool_checkout_timeouts_total', 'counter', (), s['timeouts']
+    return collect
+
+def replica_collector(app):
+    '''
+    db_replica_up for each read replica of app: 1 while it takes reads, 0
+    while it is left out after failing.
+    '''
+    def collect():
+        replicas = app.extensions.get('replicas')
+        if replicas is None:
+            return
+        for bind, up in replicas.stats().items():
+            yield 'db_replica_up', 'gauge', (('replica', bind),), 1 if up else 0
+    return collect
+
+def cache_collector(cache, stats):
+    '''
+    Hit and miss counts, size and hit ratio of a cache from its stats()
+    dict, labelled cache=<cache>.
+    '''
+    def collect():
+        s = stats()
+        labels = (('cache', cache),)
+        lookups = s['hits'] + s['misses']
+        yield 'cache_hits_total', 'counter', labels, s['hits']
+        yield 'cache_misses_total', 'counter', labels, s['misses']
+        yield 'cache_size', 'gauge', labels, s['size']
+        yield 'cache_hit_ratio', 'gauge', labels, s['hits'] / lookups if lookups else 0.0
+    return collect
+
+'''
+init_metrics(app, *collectors)
+    serves GET /metrics in Prometheus' text format: requests and latency
+    histograms by method, route (the URL rule, not the path) and status
+    code, plus the samples of collectors. The values are shared between
+    processes through METRICS_DIR (app.config or the environment) when it
+    is set. Returns the Metrics, also kept as app.extensions['metrics'].
+'''
+def init_metrics(app, *collectors):
+    app.config.setdefault('METRICS_DIR', os.environ.get('METRICS_DIR'))
+    metrics = Metrics(app.config['METRICS_DIR'])
+    metrics.declare('http_requests_total', 'counter')
+    metrics.declare('http_request_duration_seconds', 'histogram')
+    metrics.collectors.extend(collectors)
+    app.extensions['metrics'] = metrics
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def count_request(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (('method', request.method), ('route', route), ('status', response.status_code))
+        metrics.inc('http_requests_total', labels)
+        metrics.observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+        return response
+
+    @app.route('/metrics')
+    def fetch_metrics():
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+    return metrics
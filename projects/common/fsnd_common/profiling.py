@@ -0,0 +1,90 @@
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULTS = {
+    # statements taking at least this long are logged on their own
+    'PROFILE_SLOW_QUERY_MS': 100,
+    'PROFILE_SERVER_TIMING': True,
+}
+
+'''
+QueryStats
+    the SQL statements run while handling one request: how many, their
+    total time, and the (duration, statement) of the slow ones, which are
+    also logged to logger.
+'''
+class QueryStats:
+    def __init__(self, slow_query_ms, logger):
+        self.started = time.perf_counter()
+        self.slow_query_ms = slow_query_ms
+        self.logger = logger
+        self.count = 0
+        self.duration = 0.0
+        self.slow = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        if duration * 1000 >= self.slow_query_ms:
+            self.slow.append((duration, statement))
+            return True
+        return False
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profile_started = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profile_started', None)
+    if started is None or not has_request_context():
+        return
+    stats = g.get('query_stats')
+    if stats is None:
+        return
+    duration = time.perf_counter() - started
+    if stats.record(statement, duration):
+        stats.logger.warning('slow query method=%s path=%s duration_ms=%.1f statement=%r',
+                             request.method, request.path, duration * 1000, ' '.join(statement.split()))
+
+'''
+init_profiling(app)
+    counts the SQL statements of every request of app and times them. The
+    response gets a Server-Timing header (db: the statements' total time
+    and count, app: the whole request) unless PROFILE_SERVER_TIMING is off,
+    and app.logger gets one INFO line per request, plus a WARNING for each
+    statement over PROFILE_SLOW_QUERY_MS. The stats of the current request
+    are g.query_stats. Statements a streamed response runs after the view
+    has returned are not counted.
+'''
+def init_profiling(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    # engine events are process wide, the hooks look up the app's request
+    if not event.contains(Engine, 'after_cursor_execute', after_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats(app.config['PROFILE_SLOW_QUERY_MS'], app.logger)
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+        db_ms = stats.duration * 1000
+        total_ms = (time.perf_counter() - stats.started) * 1000
+
+        if app.config['PROFILE_SERVER_TIMING']:
+            response.headers.add('Server-Timing',
+                                 f'db;dur={db_ms:.1f};desc="{stats.count} queries", app;dur={total_ms:.1f}')
+        app.logger.info('request method=%s path=%s status=%d queries=%d db_ms=%.1f duration_ms=%.1f slow_queries=%d',
+                        request.method, request.path, response.status_code,
+                        stats.count, db_ms, total_ms, len(stats.slow),
+                        extra={'query_stats': {'queries': stats.count,
+                                               'db_ms': round(db_ms, 1),
+                                               'duration_ms': round(total_ms, 1),
+                                               'slow_queries': len(stats.slow)}})
+        return response
@@ -0,0 +1,205 @@
+import math
+import os
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, exc, orm, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.sql.dml import UpdateBase
+from .engine import PooledSQLAlchemy
+
+'''
+Read replicas
+    DATABASE_REPLICA_URLS (or SQLALCHEMY_REPLICAS in the app config) lists
+    read replicas of the primary database. Read-only requests - GET, HEAD
+    and views marked @read_only - run their queries on one of them, picked
+    round robin; everything else, and any flush or INSERT/UPDATE/DELETE,
+    goes to the primary. A request that wrote sets the STICKY_COOKIE, so the
+    same client reads from the primary for REPLICA_STICKY_SECONDS and sees
+    its own writes before the replicas have caught up.
+'''
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'read_primary_until'
+DEFAULTS = {
+    # seconds a client keeps reading from the primary after a write
+    'REPLICA_STICKY_SECONDS': 5,
+    # seconds a failed replica is left out before it is tried again
+    'REPLICA_RETRY_SECONDS': 30,
+}
+
+def replica_urls(app):
+    urls = app.config.get('SQLALCHEMY_REPLICAS')
+    if urls is None:
+        urls = os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+    return [url.strip() for url in urls if url.strip()]
+
+'''
+read_only(view)
+    marks a view that only reads from the database although it is not a
+    GET, like a search form's POST, so its queries can go to a replica
+'''
+def read_only(f):
+    f.read_only = True
+    return f
+
+def is_read_only_request():
+    if request.method in SAFE_METHODS:
+        return True
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'read_only', False)
+
+def reads_from_replica():
+    if not has_request_context() or g.get('wrote_primary') or not is_read_only_request():
+        return False
+    try:
+        sticky_until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        sticky_until = 0
+    return sticky_until <= time.time()
+
+'''
+Replicas
+    the replica engines of an app, handed out round robin. A read-only
+    request checks a connection out of the next replica as soon as it needs
+    one. If that fails, the replica is marked down and the request tries
+    the next one, then the primary, so it never sees the failure. A down
+    replica is left out for REPLICA_RETRY_SECONDS, then checked with a
+    SELECT 1 before it gets requests again. A replica that drops a
+    connection in the middle of a request is marked down as well, though
+    that request fails.
+'''
+class Replicas:
+    def __init__(self, db, app, urls):
+        self.db = db
+        self.app = app
+        self.urls = {f'replica_{i}': url for i, url in enumerate(urls)}
+        self.binds = list(self.urls)
+        self.retry_seconds = app.config['REPLICA_RETRY_SECONDS']
+        self.engines = {}
+        self.down_until = {}
+        self.position = 0
+        self.lock = threading.Lock()
+
+    # made like Flask-SQLAlchemy makes its engines, but kept out of
+    # SQLALCHEMY_BINDS so create_all() and drop_all() leave the replicas alone
+    def engine(self, bind):
+        with self.lock:
+            engine = self.engines.get(bind)
+            if engine is None:
+                url = make_url(self.urls[bind])
+                options = {}
+                self.db.apply_pool_defaults(self.app, options)
+                # Flask-SQLAlchemy 2.5 returns the URL it changed, which
+                # SQLAlchemy 1.4 no longer lets it change in place; 2.4
+                # changes it in place and returns None
+                rv = self.db.apply_driver_hacks(self.app, url, options)
+                if rv is not None:
+                    url, options = rv
+                options.update(self.app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+                engine = self.engines[bind] = self.db.create_engine(url, options)
+                event.listen(engine, 'handle_error', lambda context: self.handle_error(bind, context))
+        return engine
+
+    def handle_error(self, bind, context):
+        # failed connects are handled by connect()
+        if context.is_disconnect and context.connection is not None:
+            self.mark_down(bind)
+
+    def mark_down(self, bind):
+        with self.lock:
+            self.down_until[bind] = time.monotonic() + self.retry_seconds
+        self.app.logger.warning('replica %s is down, retrying in %ss', bind, self.retry_seconds)
+
+    def next_bind(self):
+        with self.lock:
+            bind = self.binds[self.position % len(self.binds)]
+            self.position += 1
+            return bind, self.down_until.get(bind)
+
+    def connect(self):
+        '''
+        A connection to the next replica that accepts one, or None when
+        every replica is down.
+        '''
+        for _ in self.binds:
+            bind, down_until = self.next_bind()
+            if down_until is not None and time.monotonic() < down_until:
+                continue
+            try:
+                connection = self.engine(bind).connect()
+                if down_until is not None:
+                    connection.execute(text('SELECT 1'))
+            except exc.DBAPIError:
+                self.mark_down(bind)
+                continue
+            if down_until is not None:
+                with self.lock:
+                    self.down_until.pop(bind, None)
+            return connection
+        return None
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return {bind: self.down_until.get(bind, now) <= now for bind in self.binds}
+
+'''
+RoutingSession
+    the session of RoutingSQLAlchemy. A read-only request keeps the replica
+    connection it was first given for all its queries, so they see one
+    consistent state. A flush or DML statement sends the request, and its
+    later reads, back to the primary.
+'''
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        replicas = self.app.extensions.get('replicas')
+        if replicas is not None and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                g.wrote_primary = True
+            elif reads_from_replica():
+                if 'replica_connection' not in g:
+                    g.replica_connection = replicas.connect()
+                if g.replica_connection is not None:
+                    return g.replica_connection
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(PooledSQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+'''
+init_replicas(app, db)
+    routes the read-only requests of app to its replicas, named replica_0,
+    replica_1, ... in the order they are listed, when db is a
+    RoutingSQLAlchemy, and sets the STICKY_COOKIE on responses to requests
+    that wrote. Without replicas it does nothing.
+'''
+def init_replicas(app, db):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    urls = replica_urls(app)
+    if not urls:
+        return None
+
+    replicas = Replicas(db, app, urls)
+    app.extensions['replicas'] = replicas
+
+    # the session only rolls back a connection it was given, so it is
+    # removed before the connection goes back to the replica's pool
+    @app.teardown_request
+    def release_replica_connection(exception):
+        connection = g.pop('replica_connection', None)
+        if connection is not None:
+            db.session.remove()
+            connection.close()
+
+    @app.after_request
+    def stick_to_primary(response):
+        if response.status_code < 400 and (g.get('wrote_primary') or not is_read_only_request()):
+            seconds = app.config['REPLICA_STICKY_SECONDS']
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + seconds:.3f}',
+                                max_age=math.ceil(seconds), httponly=True, samesite='Lax')
+        return response
+
+    return replicas
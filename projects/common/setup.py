@@ -0,0 +1,11 @@
+from setuptools import find_packages, setup
+
+setup(
+    name='fsnd-common',
+    version='0.1.0',
+    description='Database, caching, compression and metrics helpers shared by '
+                'Fyyur, the Trivia API and the coffee shop backend',
+    packages=find_packages(),
+    install_requires=['Flask', 'Flask-SQLAlchemy', 'SQLAlchemy'],
+    extras_require={'fast': ['orjson', 'brotli']},
+)